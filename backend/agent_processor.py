@@ -1,21 +1,65 @@
-import os, logging
-from typing import Generator, List, Dict, Sequence
+import os, logging, json, time, threading
+from functools import lru_cache
+from typing import Any, Generator, List, Dict, Optional, Sequence, Tuple
 from typing_extensions import TypedDict, Annotated
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from db import append_messages
-
-from models_manager import get_chat_model, is_chat_enabled
-from tools import TOOLS
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    AIMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig
+from langchain_core.callbacks import BaseCallbackHandler
+from db import append_messages, record_routing_decision
+
+from models_manager import (
+    get_chat_model,
+    get_autocomplete_model,
+    is_chat_enabled,
+    route_chat_request,
+    CHAT_MODEL,
+    AUTO_MODEL,
+)
+from tools import TOOLS, bound_tool_output
 
 # Logging setup
 log = logging.getLogger("agent_processor")
 log.setLevel(logging.INFO)
 
 Message = Dict[str, str]
+# (event type, payload) pairs; see streaming.py for the event types
+StreamEvent = Tuple[str, Dict]
+
+# --- Run budgets ---
+# Max number of agent (LLM) turns per request; the last one must answer without tools
+MAX_AGENT_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "8"))
+# Wall-clock budget per request, in seconds
+AGENT_TIME_BUDGET_S = float(os.getenv("AGENT_TIME_BUDGET_S", "180"))
+# Identical tool calls allowed per run before the model is told to stop repeating itself
+MAX_REPEATED_CALLS = int(os.getenv("AGENT_MAX_REPEATED_CALLS", "2"))
+
+# Tools whose result only depends on their arguments and the workspace state
+READ_ONLY_TOOLS = {"list_files", "project_tree", "read_file", "read_tool_output"}
+# Tools that change files at their "path" argument
+WRITE_TOOLS = {"write_file", "edit_file"}
+# Tools that can change anything in the workspace
+SIDE_EFFECT_TOOLS = {"run_terminal_command"}
+
+BUDGET_EXHAUSTED_PROMPT = (
+    "You have used up the tool budget for this request. "
+    "Do not call any more tools. Answer the user now with what you already know."
+)
+CANCELLED_MARKER = "[Cancelled] The request was stopped before it finished."
+REPEATED_CALL_NUDGE = (
+    "[Note] You already made this exact call {count} times in this task and got the result above. "
+    "Do not repeat it; use the result or answer the user."
+)
+# Sent instead of the full result once a memoized call is repeated too often
+REPEATED_RESULT = "[Same result as your earlier call {call_id}; it has not changed.]"
 
 # --- SYSTEM PROMPT ---
 SYSTEM_PROMPT = """
@@ -30,9 +74,18 @@ Help the user write code, debug issues, and explore their repository efficiently
 
 ### Rules
 1. **Directness:** If you can answer without a tool, do so immediately.
-2. **Verification:** Do not guess file paths. Use `list_directory` to check before reading.
+2. **Verification:** Do not guess file paths. Use `project_tree` once to see the project layout before reading.
 3. **Tool Usage:** Call tools directly when needed. Do not explain that you are going to use a tool. Just use it.
 4. **Safety:** Warn the user before running destructive terminal commands.
+5. **Edits:** To change an existing file, use `edit_file` with only the changed lines. Use `write_file` only for new files.
+"""
+
+ESCALATE_TOKEN = "ESCALATE"
+SMALL_MODEL_PROMPT = f"""
+You are a fast local Coding Assistant running inside VSCode. Answer concisely.
+You cannot read or write files, run commands or browse the web.
+If the task needs any of that, or you are not confident you can answer it correctly,
+reply with exactly {ESCALATE_TOKEN} and nothing else.
 """
 
 
@@ -46,14 +99,63 @@ def format_tools_description() -> str:
     )
 
 
+# --- Cancellation ---
+class RunCancelled(Exception):
+    """Raised inside the graph once the run's cancel event is set."""
+
+
+class CancelCallback(BaseCallbackHandler):
+    """
+    Aborts the run from inside LLM and tool calls. Raising from on_llm_new_token
+    stops reading the Ollama stream, which closes the HTTP connection so Ollama
+    stops generating.
+    """
+
+    raise_error = True
+
+    def __init__(self, cancel_event: threading.Event):
+        self.cancel_event = cancel_event
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise RunCancelled()
+
+    def on_chat_model_start(self, serialized: Dict, messages: Any, **kwargs):
+        self.check()
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.check()
+
+    def on_tool_start(self, serialized: Dict, input_str: str, **kwargs):
+        self.check()
+
+
+def check_cancelled(config: RunnableConfig):
+    cancel_event = config.get("configurable", {}).get("cancel_event")
+    if cancel_event is not None and cancel_event.is_set():
+        raise RunCancelled()
+
+
 # --- Agent State ---
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    iterations: int  # agent turns taken so far
+    deadline: float  # time.monotonic() after which the agent must answer
+    tool_memo: Dict[str, Tuple[str, str]]  # call key -> (id of the call that produced it, result)
+    call_counts: Dict[str, int]  # call key -> times requested in this run (writes not counted)
+
+
+def budget_exhausted(state: AgentState) -> bool:
+    return (
+        state.get("iterations", 0) >= MAX_AGENT_ITERATIONS
+        or time.monotonic() >= state.get("deadline", float("inf"))
+    )
 
 
 # --- Agent Node ---
-def agent_node(state: AgentState) -> AgentState:
+def agent_node(state: AgentState, config: RunnableConfig) -> AgentState:
     messages = state["messages"]
+    iterations = state.get("iterations", 0) + 1
 
     llm = get_chat_model()
 
@@ -65,10 +167,19 @@ def agent_node(state: AgentState) -> AgentState:
         return {"messages": [AIMessage(content=f"❌ {error_msg}")]}
 
     try:
-        llm_with_tools = llm.bind_tools(tools)
-        response = llm_with_tools.invoke(messages)
+        if budget_exhausted({**state, "iterations": iterations}):
+            # Last turn: no tools bound, so the model has to answer
+            log.warning(f"Agent budget exhausted after {iterations - 1} iterations")
+            response = llm.invoke(
+                list(messages) + [SystemMessage(content=BUDGET_EXHAUSTED_PROMPT)], config
+            )
+        else:
+            llm_with_tools = llm.bind_tools(tools)
+            response = llm_with_tools.invoke(messages, config)
 
-        return {"messages": [response]}
+        return {"messages": [response], "iterations": iterations}
+    except RunCancelled:
+        raise
     except Exception as e:
         err = f"[Agent error] {type(e).__name__}: {e}"
         log.exception(err)
@@ -84,6 +195,9 @@ def route_after_agent(state: AgentState):
     last = messages[-1]
     # Check if last message has tool calls
     if isinstance(last, AIMessage) and last.tool_calls:
+        if budget_exhausted(state):
+            log.warning("Agent budget exhausted, ignoring further tool calls")
+            return END
         log.info(f"Routing to tools: {[tc.get('name') for tc in last.tool_calls]}")
         return "tools"
 
@@ -91,30 +205,130 @@ def route_after_agent(state: AgentState):
 
 
 # --- Tool Node ---
-tool_node = ToolNode([func for _, func in TOOLS.items()])
+@lru_cache(maxsize=None)
+def get_tool_executor():
+    # langgraph.prebuilt is slow to import, so it is only loaded for the first tool call
+    from langgraph.prebuilt import ToolNode
+
+    return ToolNode([func for _, func in TOOLS.items()], name="tool_executor")
 
-# --- Build Graph ---
-builder = StateGraph(AgentState)
 
-builder.add_node("agent", agent_node)
-builder.add_node("tools", tool_node)
+def tool_call_key(call: Dict) -> str:
+    return f"{call['name']}:{json.dumps(call.get('args', {}), sort_keys=True)}"
 
-builder.set_entry_point("agent")
-builder.add_edge(START, "agent")
-builder.add_conditional_edges("agent", route_after_agent, {"tools": "tools", END: END})
-builder.add_edge("tools", "agent")
 
-agent = builder.compile()
+def invalidate_memo(memo: Dict[str, Tuple[str, str]], call: Dict):
+    """Drop memoized results that a write/side-effect tool call may have made stale."""
+    if call["name"] in SIDE_EFFECT_TOOLS:
+        memo.clear()
+        return
 
-# Draw the graph of the agent
-try:
-    if not os.path.exists("agent_graph.png"):
-        png_bytes = agent.get_graph().draw_mermaid_png()
-        with open("agent_graph.png", "wb") as f:
-            f.write(png_bytes)
-        log.info("Agent graph created: agent_graph.png")
-except Exception as e:
-    log.warning(f"Could not create graph visualization: {e}")
+    path = os.path.normpath(str(call.get("args", {}).get("path", "")))
+    for key in list(memo):
+        name, _, args = key.partition(":")
+        # Any directory listing may now be stale; reads only for the written path
+        if name != "read_file" or os.path.normpath(
+            str(json.loads(args).get("path", ""))
+        ) == path:
+            memo.pop(key)
+
+
+def tools_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Execute the tool calls of the last agent message.
+    Read-only calls already made in this run are answered from the memo, and
+    repeated calls get a nudge appended so the model stops looping. Past
+    MAX_REPEATED_CALLS a memoized result is not sent again, only referred to.
+    """
+    check_cancelled(config)
+    last = state["messages"][-1]
+    memo = dict(state.get("tool_memo") or {})
+    counts = dict(state.get("call_counts") or {})
+
+    results: Dict[str, ToolMessage] = {}
+    pending = []
+    for call in last.tool_calls:
+        key = tool_call_key(call)
+        if call["name"] not in WRITE_TOOLS:
+            # Writing the same content twice is not a loop worth stopping
+            counts[key] = counts.get(key, 0) + 1
+        if call["name"] in READ_ONLY_TOOLS and key in memo:
+            log.info(f"Serving repeated tool call from memo: {key}")
+            earlier_id, content = memo[key]
+            if counts[key] > MAX_REPEATED_CALLS:
+                content = REPEATED_RESULT.format(call_id=earlier_id)
+            results[call["id"]] = ToolMessage(
+                content=content, tool_call_id=call["id"], name=call["name"]
+            )
+        else:
+            pending.append(call)
+
+    if pending:
+        output = get_tool_executor().invoke(
+            {"messages": [AIMessage(content="", tool_calls=pending)]}, config
+        )
+        # Tools report cancellation as a result; don't feed it back to the model
+        check_cancelled(config)
+        for call, msg in zip(pending, output["messages"]):
+            if isinstance(msg.content, str):
+                # Large outputs are spilled to disk so they aren't re-sent on every iteration
+                bounded = bound_tool_output(call["name"], msg.content)
+                if bounded is not msg.content:
+                    msg = ToolMessage(
+                        content=bounded,
+                        tool_call_id=msg.tool_call_id,
+                        name=msg.name,
+                        status=msg.status,
+                    )
+            if call["name"] in WRITE_TOOLS or call["name"] in SIDE_EFFECT_TOOLS:
+                invalidate_memo(memo, call)
+            elif call["name"] in READ_ONLY_TOOLS and msg.status != "error":
+                memo[tool_call_key(call)] = (call["id"], msg.content)
+            results[call["id"]] = msg
+
+    messages = []
+    for call in last.tool_calls:
+        msg = results[call["id"]]
+        count = counts.get(tool_call_key(call), 0)
+        if count > MAX_REPEATED_CALLS:
+            # Covers plain repeats as well as cycles (A, B, A, B ...)
+            log.warning(f"Repeated tool call detected ({count}x): {call['name']}")
+            msg = ToolMessage(
+                content=f"{msg.content}\n\n{REPEATED_CALL_NUDGE.format(count=count)}",
+                tool_call_id=msg.tool_call_id,
+                name=msg.name,
+                status=msg.status,
+            )
+        messages.append(msg)
+
+    return {"messages": messages, "tool_memo": memo, "call_counts": counts}
+
+
+# --- Build Graph ---
+@lru_cache(maxsize=None)
+def get_agent():
+    """Compile the agent graph on first use (keeps it off the import/startup path)."""
+    builder = StateGraph(AgentState)
+
+    builder.add_node("agent", agent_node)
+    builder.add_node("tools", tools_node)
+
+    builder.set_entry_point("agent")
+    builder.add_edge(START, "agent")
+    builder.add_conditional_edges(
+        "agent", route_after_agent, {"tools": "tools", END: END}
+    )
+    builder.add_edge("tools", "agent")
+
+    return builder.compile()
+
+
+def render_graph(path: str = "agent_graph.png"):
+    """Draw the agent graph to a PNG. Uses a remote Mermaid renderer."""
+    png_bytes = get_agent().get_graph().draw_mermaid_png()
+    with open(path, "wb") as f:
+        f.write(png_bytes)
+    log.info(f"Agent graph created: {path}")
 
 
 # --- Helpers ---
@@ -143,19 +357,65 @@ def build_message_history(memory: List[Message]) -> List[BaseMessage]:
     return messages
 
 
+# --- Small model path ---
+def stream_small_model(
+    messages: List[BaseMessage], run_config: RunnableConfig
+) -> Generator[StreamEvent, None, Optional[str]]:
+    """
+    Answer with the small model, without tools. The first characters are held
+    back until it is clear the model did not escalate.
+    Returns the answer, or None if the request has to go to the large model.
+    """
+    llm = get_autocomplete_model()
+    if llm is None:
+        return None
+
+    held, answer = "", None
+    for chunk in llm.stream(messages, run_config):
+        text = extract_text_from_msg(chunk)
+        if answer is not None:
+            if text:
+                answer += text
+                yield "token", {"text": text}
+            continue
+
+        held += text
+        if held.lstrip().startswith(ESCALATE_TOKEN):
+            return None
+        if ESCALATE_TOKEN.startswith(held.lstrip()):
+            continue  # could still become the escalation token
+        answer = held
+        yield "token", {"text": held}
+
+    if answer is None:
+        # Stream ended while the output was still a prefix of the token
+        if not held.strip():
+            return None
+        answer = held
+        yield "token", {"text": held}
+    return answer
+
+
 # --- Streaming execution ---
 def stream_model(
-    code: str, instruction: str, memory: List[Message], session_id: str
-) -> Generator[str, None, None]:
+    code: str,
+    instruction: str,
+    memory: List[Message],
+    session_id: str,
+    cancel_event: Optional[threading.Event] = None,
+) -> Generator[StreamEvent, None, None]:
     """
-    Stream agent responses and tool outputs.
-    Checks if chat is enabled before processing.
+    Stream agent responses and tool outputs as typed events:
+    ("token", {"text"}), ("tool_start", {"tools"}), ("tool_output", {"text"}),
+    ("error", {"message"}), ("cancelled", {"message"}).
+    Checks if chat is enabled before processing. Setting `cancel_event` aborts
+    the run, including the Ollama generation and running tool processes.
     """
 
     if not is_chat_enabled():
         error_msg = "❌ Chat assistant is currently disabled. Please enable it in VSCode settings."
         log.warning("Attempted to use chat while disabled")
-        yield error_msg
+        yield "error", {"message": error_msg}
         append_messages(session_id, "assistant", error_msg)
         return
 
@@ -171,38 +431,126 @@ def stream_model(
 
     full_response = ""
 
+    initial_state = {
+        "messages": messages_input,
+        "iterations": 0,
+        "deadline": time.monotonic() + AGENT_TIME_BUDGET_S,
+        "tool_memo": {},
+        "call_counts": {},
+    }
+    # Safety net on top of MAX_AGENT_ITERATIONS: each iteration is an agent and a tools step
+    run_config = {"recursion_limit": 2 * MAX_AGENT_ITERATIONS + 4}
+    if cancel_event is not None:
+        run_config["callbacks"] = [CancelCallback(cancel_event)]
+        run_config["configurable"] = {"cancel_event": cancel_event}
+
+    # --- Routing stage: try the small model first for simple, tool-free requests ---
+    started = time.monotonic()
+    decision = route_chat_request(instruction, code)
+    routing = {
+        "session_id": session_id,
+        "model": CHAT_MODEL,
+        "route": decision.model,
+        "reason": decision.reason,
+        "confidence": decision.confidence,
+        "escalated": False,
+        "instruction_chars": len(instruction),
+        "code_chars": len(code or ""),
+    }
+    log.info(f"Routing chat request to {decision.model} model: {decision.reason}")
+
+    if decision.model == "small":
+        small_messages = [SystemMessage(content=SMALL_MODEL_PROMPT)]
+        small_messages.extend(build_message_history(memory))
+        small_messages.append(HumanMessage(content=user_prompt))
+        small = stream_small_model(small_messages, run_config)
+        shown = ""  # what the client has already received from the small model
+        try:
+            while True:
+                event, data = next(small)
+                shown += data["text"]
+                yield event, data
+        except StopIteration as done:
+            answer = done.value
+        except RunCancelled:
+            log.info(f"Run cancelled for session {session_id}")
+            if shown.strip():
+                append_messages(session_id, "assistant", shown)
+            append_messages(session_id, "assistant", CANCELLED_MARKER)
+            yield "cancelled", {"message": CANCELLED_MARKER}
+            return
+        except Exception as e:
+            if shown:
+                # Too late to escalate: the large model's answer would be appended
+                # to the partial one the client already shows
+                err = f"[Agent error] {type(e).__name__}: {e}"
+                log.exception(err)
+                yield "error", {"message": err}
+                append_messages(session_id, "assistant", shown)
+                append_messages(session_id, "assistant", err)
+                record_routing_decision(
+                    {
+                        **routing,
+                        "model": AUTO_MODEL,
+                        "error": err,
+                        "latency_s": time.monotonic() - started,
+                    }
+                )
+                return
+            log.warning(f"Small model failed, escalating: {type(e).__name__}: {e}")
+            answer = None
+
+        if answer is not None:
+            append_messages(session_id, "assistant", answer)
+            record_routing_decision(
+                {**routing, "model": AUTO_MODEL, "latency_s": time.monotonic() - started}
+            )
+            return
+        log.info("Small model escalated the request to the large model")
+        routing["escalated"] = True
+
     try:
-        for msg, meta in agent.stream(
-            {"messages": messages_input}, stream_mode="messages"
+        for msg, meta in get_agent().stream(
+            initial_state, config=run_config, stream_mode="messages"
         ):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RunCancelled()
+
             node = meta.get("langgraph_node")
             text = extract_text_from_msg(msg)
-            if not text:
-                continue
 
             # Stream assistant replies
             if node == "agent" and isinstance(msg, AIMessage):
-                # Don't stream tool call declarations, only actual content
-                if not msg.tool_calls:
-                    yield text
+                # Don't stream tool call declarations, only announce them
+                if msg.tool_calls:
+                    names = [tc.get("name") for tc in msg.tool_calls]
+                    log.info(f"Agent calling tools: {names}")
+                    yield "tool_start", {"tools": names}
+                elif text:
+                    yield "token", {"text": text}
                     full_response += text
-                else:
-                    log.info(
-                        f"Agent calling tools: {[tc.get('name') for tc in msg.tool_calls]}"
-                    )
 
             # Stream tool outputs inline
-            elif node == "tools":
+            elif node == "tools" and text:
                 tool_output = f"\n [Tool output]: {text}\n"
-                yield tool_output
+                yield "tool_output", {"text": tool_output}
                 append_messages(session_id, "assistant", tool_output)
 
+    except RunCancelled:
+        log.info(f"Run cancelled for session {session_id}")
+        if full_response.strip():
+            append_messages(session_id, "assistant", full_response)
+        append_messages(session_id, "assistant", CANCELLED_MARKER)
+        yield "cancelled", {"message": CANCELLED_MARKER}
+        return
     except Exception as e:
         err = f"[Agent error] {type(e).__name__}: {e}"
         log.exception(err)
-        yield f"\n❌ {err}\n"
+        yield "error", {"message": err}
         append_messages(session_id, "assistant", err)
 
+    record_routing_decision({**routing, "latency_s": time.monotonic() - started})
+
     if full_response.strip():
         append_messages(session_id, "assistant", full_response)
     else:
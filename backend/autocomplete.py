@@ -1,12 +1,22 @@
 # autocomplete.py
-from fastapi import APIRouter, HTTPException
+import asyncio, os, time
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional, List, Generator
-from langchain_ollama import ChatOllama
+from typing import Dict, Optional, List, Generator
 from models_manager import get_autocomplete_model, is_autocomplete_enabled
 
 router = APIRouter()
 
+# Speculative mode: after answering, precompute the completion that follows
+# the returned one, in case the user accepts it and keeps going. Slots live in
+# process memory: a request that lands on another uvicorn worker misses the slot
+# and is completed normally, and the stale slot expires after SPECULATION_TTL_S.
+SPECULATIVE_ENABLED = os.getenv("AUTOCOMPLETE_SPECULATIVE", "1") == "1"
+SPECULATION_TTL_S = float(os.getenv("AUTOCOMPLETE_SPECULATION_TTL_S", "30"))
+# Speculation waits this long, and until no foreground completion is running
+SPECULATION_DELAY_S = 0.05
+MAX_SPECULATIVE_SLOTS = 256
+
 
 class AutocompleteRequest(BaseModel):
     before: str
@@ -14,44 +24,135 @@ class AutocompleteRequest(BaseModel):
     language: Optional[str] = "plain"
     max_tokens: Optional[int] = 128
     top_k: Optional[int] = 1
+    client_id: Optional[str] = None  # one speculative slot per client
+    speculative: Optional[bool] = True
+
+
+class SpeculativeSlot:
+    """A background completion for the text expected after an accepted suggestion."""
+
+    def __init__(self, before: str, after: str, language: str, task: asyncio.Task):
+        self.before = before
+        self.after = after
+        self.language = language
+        self.task = task
+        self.expires = time.monotonic() + SPECULATION_TTL_S
+
+    def matches(self, req: AutocompleteRequest) -> bool:
+        # The client trims the accepted text, so trailing whitespace may differ
+        return (
+            time.monotonic() < self.expires
+            and req.before.rstrip() == self.before.rstrip()
+            and (req.after or "") == self.after
+            and req.language == self.language
+        )
+
+
+_slots: Dict[str, SpeculativeSlot] = {}
+_foreground = 0  # foreground completions in flight in this worker
+
+
+async def complete(llm_code, before: str, after: str, language: str) -> str:
+    prompt = build_prompt(before, after, language)
+    response = await llm_code.ainvoke(
+        [
+            {
+                "role": "system",
+                "content": f"You are a fast {language} code completion engine. Output ONLY code. No markdown.",
+            },
+            {"role": "user", "content": prompt},
+        ]
+    )
+
+    content = response.content
+
+    # Clean up common chat-model artifacts (markdown blocks)
+    return content.replace("```" + language, "").replace("```", "").strip()
+
+
+async def speculate(llm_code, before: str, after: str, language: str) -> str:
+    """Low priority: only runs while no foreground completion is in flight."""
+    await asyncio.sleep(SPECULATION_DELAY_S)
+    while _foreground:
+        await asyncio.sleep(SPECULATION_DELAY_S)
+    return await complete(llm_code, before, after, language)
+
+
+async def take_speculative(client: str, req: AutocompleteRequest) -> Optional[str]:
+    """
+    Return the speculative completion if it was made for this request.
+    Otherwise the user typed something else: cancel it.
+    """
+    slot = _slots.pop(client, None)
+    if slot is None:
+        return None
+    if not slot.matches(req):
+        slot.task.cancel()
+        return None
+    try:
+        return await slot.task  # usually finished already
+    except (asyncio.CancelledError, Exception):
+        return None
+
+
+def cancel_speculations():
+    """
+    Cancel speculations still generating, so they don't compete with a
+    foreground completion for the model. Finished ones are kept.
+    """
+    for client, slot in list(_slots.items()):
+        if not slot.task.done():
+            slot.task.cancel()
+            del _slots[client]
+
+
+def start_speculation(client: str, llm_code, req: AutocompleteRequest, completion: str):
+    if len(_slots) >= MAX_SPECULATIVE_SLOTS:
+        _slots.pop(next(iter(_slots))).task.cancel()
+
+    before = req.before + completion
+    after = req.after or ""
+    task = asyncio.create_task(speculate(llm_code, before, after, req.language))
+    # Unclaimed speculations may fail or be cancelled; don't log them as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _slots[client] = SpeculativeSlot(before, after, req.language, task)
 
 
 @router.post("/autocomplete")
-async def autocomplete(req: AutocompleteRequest):
+async def autocomplete(req: AutocompleteRequest, request: Request):
     """
     Fast code completion endpoint.
     """
+    global _foreground
 
+    client = req.client_id or (request.client.host if request.client else "default")
     if not is_autocomplete_enabled():
+        slot = _slots.pop(client, None)
+        if slot:
+            slot.task.cancel()
         return {"completions": []} 
     
     llm_code = get_autocomplete_model()
     if llm_code is None:
         return {"completions": []}
 
-    prompt = build_prompt(req.before, req.after, req.language)
+    cleaned = await take_speculative(client, req)
 
-    try:
-        response = llm_code.invoke(
-            [
-                {
-                    "role": "system",
-                    "content": f"You are a fast {req.language} code completion engine. Output ONLY code. No markdown.",
-                },
-                {"role": "user", "content": prompt},
-            ]
-        )
-
-        content = response.content
-
-        # Clean up common chat-model artifacts (markdown blocks)
-        cleaned = content.replace("```" + req.language, "").replace("```", "").strip()
+    if cleaned is None:
+        cancel_speculations()
+        _foreground += 1
+        try:
+            cleaned = await complete(llm_code, req.before, req.after or "", req.language)
+        except Exception as e:
+            print(f"Autocomplete Error: {e}")
+            return {"completions": []}
+        finally:
+            _foreground -= 1
 
-        return {"completions": [cleaned]}
+    if SPECULATIVE_ENABLED and req.speculative and cleaned:
+        start_speculation(client, llm_code, req, cleaned)
 
-    except Exception as e:
-        print(f"Autocomplete Error: {e}")
-        return {"completions": []}
+    return {"completions": [cleaned]}
 
 
 def build_prompt(before: str, after: str, language: str) -> str:
@@ -0,0 +1,155 @@
+"""
+Command line utilities for the backend.
+
+    python cli.py render-graph [--out agent_graph.png]
+    python cli.py bench-startup [--runs 5] [--port 8765]
+    python cli.py export --out sessions.ndjson.gz [--after SESSION_ID] [--updated-before DATE]
+    python cli.py import --in sessions.ndjson.gz [--batch-size 200]
+    python cli.py prune --older-than-days 90
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+
+def render_graph_cmd(args):
+    from agent_processor import render_graph
+
+    render_graph(args.out)
+    print(f"Agent graph written to {args.out}")
+
+
+def _time_import(module: str) -> float:
+    """Seconds to import `module` in a fresh interpreter."""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - t)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _time_to_ready(port: int, wait_ready: bool, timeout: float) -> float:
+    """Seconds from spawning uvicorn until /health answers (and reports ready)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                res = requests.get(f"http://127.0.0.1:{port}/health", timeout=0.5)
+                if res.ok and (not wait_ready or res.json().get("ready")):
+                    return time.perf_counter() - start
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"Server not ready after {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def bench_startup_cmd(args):
+    imports = [_time_import("main") for _ in range(args.runs)]
+    ready = [
+        _time_to_ready(args.port, args.wait_ready, args.timeout)
+        for _ in range(args.runs)
+    ]
+
+    for label, samples in (("import main", imports), ("time to /health", ready)):
+        print(
+            f"{label:>16}: median {statistics.median(samples) * 1000:.0f} ms, "
+            f"min {min(samples) * 1000:.0f} ms, max {max(samples) * 1000:.0f} ms "
+            f"({len(samples)} runs)"
+        )
+
+
+def export_cmd(args):
+    from session_archive import export_sessions
+
+    updated_before = (
+        datetime.fromisoformat(args.updated_before) if args.updated_before else None
+    )
+    with open(args.out, "wb") as f:
+        for chunk in export_sessions(
+            after=args.after, updated_before=updated_before, compress=not args.no_compress
+        ):
+            f.write(chunk)
+    print(f"Sessions exported to {args.out}")
+
+
+def import_cmd(args):
+    from session_archive import import_archive
+
+    with open(args.input, "rb") as f:
+        totals = import_archive(
+            iter(lambda: f.read(64 * 1024), b""), batch_size=args.batch_size
+        )
+    print(
+        f"Imported {totals['imported']} sessions, skipped {totals['skipped']} "
+        f"already present (last: {totals['last_session_id']})"
+    )
+    if totals["truncated"]:
+        print("Warning: the archive is truncated; its incomplete last session was skipped")
+
+
+def prune_cmd(args):
+    from db import delete_sessions
+
+    cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+    deleted = delete_sessions(cutoff)
+    print(f"Deleted {deleted} sessions not updated since {cutoff:%Y-%m-%d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coding agent backend utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("render-graph", help="Draw the agent graph to a PNG")
+    p.add_argument("--out", default="agent_graph.png")
+    p.set_defaults(func=render_graph_cmd)
+
+    p = sub.add_parser("bench-startup", help="Measure import and time-to-ready")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.add_argument(
+        "--wait-ready",
+        action="store_true",
+        help="Also wait for Mongo/model state initialization to finish",
+    )
+    p.set_defaults(func=bench_startup_cmd)
+
+    p = sub.add_parser("export", help="Export sessions to a (gzip) NDJSON archive")
+    p.add_argument("--out", required=True)
+    p.add_argument("--after", help="Resume after this session_id")
+    p.add_argument("--updated-before", help="Only sessions last updated before this ISO date")
+    p.add_argument("--no-compress", action="store_true")
+    p.set_defaults(func=export_cmd)
+
+    p = sub.add_parser("import", help="Import a session archive (re-runnable)")
+    p.add_argument("--in", dest="input", required=True)
+    p.add_argument("--batch-size", type=int, default=200)
+    p.set_defaults(func=import_cmd)
+
+    p = sub.add_parser("prune", help="Delete old sessions")
+    p.add_argument("--older-than-days", type=int, required=True)
+    p.set_defaults(func=prune_cmd)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,43 @@
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Iterator
+import base64
+import json
 import uuid
+import zlib
 import os 
 
 MONGO_URL = os.getenv("MONGODB_URL", "mongodb://127.0.0.1:27017")
+MONGO_TIMEOUT_MS = int(os.getenv("MONGODB_TIMEOUT_MS", "5000"))
 
-client = MongoClient(MONGO_URL)
+# connect=False: no network I/O at import time, the first operation connects
+client = MongoClient(
+    MONGO_URL, connect=False, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS
+)
 db = client["ai_assistant"]
 sessions_col = db["sessions"]
 meta_col = db["meta"]
-
-# Ensure index on session_id for quick lookups
-sessions_col.create_index([("session_id", ASCENDING)], unique=True)
+# Large message bodies (tool outputs, whole files) live here, zlib-compressed
+blobs_col = db["message_blobs"]
+# One document per chat request: which model answered and why (for tuning the router)
+routing_col = db["routing_decisions"]
+# /stream-code runs and their events, so any worker can resume or cancel a stream
+streams_col = db["streams"]
+stream_events_col = db["stream_events"]
 
 Message = Dict[str, str]
 
+DEFAULT_PAGE_SIZE = 100
+
+# Messages longer than this are stored out of line; only a preview stays in the session
+INLINE_CONTENT_LIMIT = int(os.getenv("MESSAGE_INLINE_LIMIT", "4096"))
+PREVIEW_CHARS = 512
+
+# Routing decisions are only kept for tuning; Mongo expires them after this long
+ROUTING_DECISIONS_TTL_S = int(os.getenv("ROUTING_DECISIONS_TTL_S", str(30 * 24 * 3600)))
+# Streams and their events are only needed for resuming; expire them after this long
+STREAM_RETENTION_S = int(os.getenv("STREAM_RETENTION_S", "3600"))
+
 
 def create_session(
     session_id: Optional[str] = None,
@@ -61,14 +83,166 @@ def set_current_session(session_id: str):
     )
 
 
+def get_model_state() -> Dict:
+    """Return the shared feature flags ({"chat_enabled", "auto_enabled"}), {} if never set."""
+    doc = meta_col.find_one({"_id": "model_state"}, {"_id": 0})
+    return doc or {}
+
+
+def set_model_state(**flags: bool):
+    """Update shared feature flags, e.g. set_model_state(chat_enabled=True)."""
+    meta_col.update_one(
+        {"_id": "model_state"},
+        {"$set": {**flags, "updated": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def init_model_state(**flags: bool):
+    """Seed shared feature flags only if no worker has set them yet."""
+    meta_col.update_one(
+        {"_id": "model_state"},
+        {"$setOnInsert": {**flags, "updated": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def record_routing_decision(decision: Dict):
+    """Store a chat routing decision. Never raises: logging must not break a chat."""
+    try:
+        routing_col.insert_one({**decision, "ts": datetime.utcnow()})
+    except Exception as e:
+        print(f"Failed to record routing decision: {e}")
+
+
+def register_stream(stream_id: str, session_id: str):
+    """Record a new stream and flag the session's other running streams as superseded."""
+    streams_col.update_many(
+        {"session_id": session_id, "done": False},
+        {"$set": {"cancel_reason": "superseded by a new request"}},
+    )
+    streams_col.insert_one(
+        {
+            "_id": stream_id,
+            "session_id": session_id,
+            "done": False,
+            "created_at": datetime.utcnow(),
+        }
+    )
+
+
+def append_stream_events(stream_id: str, events: List[Tuple[int, str, Dict]]):
+    """Store (id, event, data) events of a stream; a "done" event marks it finished."""
+    now = datetime.utcnow()
+    stream_events_col.insert_many(
+        [
+            {"stream_id": stream_id, "seq": seq, "event": event, "data": data, "ts": now}
+            for seq, event, data in events
+        ],
+        ordered=True,
+    )
+    if any(event == "done" for _, event, _ in events):
+        streams_col.update_one({"_id": stream_id}, {"$set": {"done": True}})
+
+
+def get_stream(stream_id: str) -> Optional[Dict]:
+    return streams_col.find_one({"_id": stream_id})
+
+
+def get_stream_events(stream_id: str, after: int) -> List[Tuple[int, str, Dict]]:
+    """Events of a stream with id > after, in order; also marks the stream as being read."""
+    streams_col.update_one({"_id": stream_id}, {"$set": {"reader_seen": datetime.utcnow()}})
+    cursor = stream_events_col.find(
+        {"stream_id": stream_id, "seq": {"$gt": after}}, {"_id": 0}
+    ).sort("seq", ASCENDING)
+    return [(doc["seq"], doc["event"], doc["data"]) for doc in cursor]
+
+
+def request_stream_cancel(stream_id: str, reason: str) -> bool:
+    """Ask the worker running a stream to cancel it. Returns False if the stream is unknown."""
+    result = streams_col.update_one(
+        {"_id": stream_id}, {"$set": {"cancel_reason": reason}}
+    )
+    return result.matched_count > 0
+
+
+def get_stream_cancel_requests(stream_ids: List[str]) -> Dict[str, str]:
+    """stream_id -> cancel reason, for the given streams that were asked to stop."""
+    cursor = streams_col.find(
+        {"_id": {"$in": stream_ids}, "cancel_reason": {"$exists": True}},
+        {"cancel_reason": 1},
+    )
+    return {doc["_id"]: doc["cancel_reason"] for doc in cursor}
+
+
+def stream_read_since(stream_id: str, seconds: float) -> bool:
+    """True if some worker served events of this stream within the last `seconds`."""
+    doc = streams_col.find_one({"_id": stream_id}, {"reader_seen": 1})
+    seen = doc.get("reader_seen") if doc else None
+    return bool(seen) and (datetime.utcnow() - seen).total_seconds() < seconds
+
+
 def session_exists(session_id: str) -> bool:
     """Return True if a session with session_id exists in sessions collection."""
     return sessions_col.count_documents({"session_id": session_id}, limit=1) > 0
 
 
-def get_messages(session_id: str, limit: Optional[int] = None) -> List[Message]:
+def _make_blob(session_id: str, content: str) -> Dict:
+    return {
+        "blob_id": uuid.uuid4().hex,
+        "session_id": session_id,
+        "codec": "zlib",
+        "size": len(content),
+        "data": zlib.compress(content.encode("utf-8")),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _move_out_of_line(session_id: str, msg: Message) -> Optional[Dict]:
+    """
+    If msg is too large to keep inline, replace its content with a preview
+    (in place) and return the blob document to store; otherwise return None.
+    """
+    content = msg["content"]
+    if len(content) <= INLINE_CONTENT_LIMIT:
+        return None
+    blob = _make_blob(session_id, content)
+    msg["content"] = content[:PREVIEW_CHARS] + f"\n... [{len(content)} chars total]"
+    msg["blob_id"] = blob["blob_id"]
+    msg["size"] = len(content)
+    return blob
+
+
+def expand_messages(messages: List[Message]) -> List[Message]:
+    """
+    Replace previews of out-of-line messages with their full content.
+    All referenced blobs are fetched in a single query.
+    """
+    blob_ids = [m["blob_id"] for m in messages if m.get("blob_id")]
+    if not blob_ids:
+        return messages
+
+    blobs = {
+        b["blob_id"]: zlib.decompress(b["data"]).decode("utf-8")
+        for b in blobs_col.find({"blob_id": {"$in": blob_ids}}, {"_id": 0, "blob_id": 1, "data": 1})
+    }
+
+    expanded = []
+    for m in messages:
+        blob_id = m.get("blob_id")
+        if blob_id in blobs:
+            m = {k: v for k, v in m.items() if k not in ("blob_id", "size")}
+            m["content"] = blobs[blob_id]
+        expanded.append(m)
+    return expanded
+
+
+def get_messages(
+    session_id: str, limit: Optional[int] = None, expand: bool = True
+) -> List[Message]:
     """
     Return messages for a session. If limit is provided, returns the last `limit` messages.
+    If expand is False, out-of-line messages keep their preview and `blob_id` reference.
     """
     if limit:
         doc = sessions_col.find_one(
@@ -82,19 +256,80 @@ def get_messages(session_id: str, limit: Optional[int] = None) -> List[Message]:
     if not doc:
         return []
 
-    return doc.get("messages", [])
+    messages = doc.get("messages", [])
+    return expand_messages(messages) if expand else messages
+
+
+def count_messages(session_id: str) -> int:
+    """Return the number of messages stored for a session (0 if it doesn't exist)."""
+    docs = list(
+        sessions_col.aggregate(
+            [
+                {"$match": {"session_id": session_id}},
+                {"$project": {"_id": 0, "n": {"$size": {"$ifNull": ["$messages", []]}}}},
+            ]
+        )
+    )
+    return docs[0]["n"] if docs else 0
+
+
+def get_messages_page(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    expand: bool = False,
+) -> Tuple[List[Message], Optional[str]]:
+    """
+    Return one page of messages in chronological order, plus the cursor of the next page.
+    The cursor is the offset of the first message of the page; next cursor is None at the end.
+    Out-of-line messages are returned as previews unless expand=True.
+    """
+    offset = int(cursor) if cursor else 0
+    # Fetch one extra message to know whether another page exists
+    doc = sessions_col.find_one(
+        {"session_id": session_id},
+        {"_id": 0, "messages": {"$slice": [offset, limit + 1]}},
+    )
+    if not doc:
+        return [], None
+
+    messages = doc.get("messages", [])
+    next_cursor = str(offset + limit) if len(messages) > limit else None
+    messages = messages[:limit]
+    return (expand_messages(messages) if expand else messages), next_cursor
+
+
+def iter_messages(
+    session_id: str, batch_size: int = DEFAULT_PAGE_SIZE, expand: bool = False
+) -> Iterator[Message]:
+    """
+    Yield all messages of a session in order, fetching `batch_size` at a time
+    so long histories are never loaded in one piece.
+    """
+    cursor: Optional[str] = None
+    while True:
+        page, cursor = get_messages_page(
+            session_id, cursor=cursor, limit=batch_size, expand=expand
+        )
+        yield from page
+        if cursor is None:
+            return
 
 
 def append_messages(session_id: str, role: str, content: str):
     """
     Append a single message (user/assistant) to session.
     Creates session document if it doesn't exist.
+    Content longer than INLINE_CONTENT_LIMIT is stored out of line (see expand_messages).
     """
     msg = {
         "role": role,
         "content": content,
         "ts": datetime.utcnow().isoformat(),  # ISO string is handy for JSON
     }
+    blob = _move_out_of_line(session_id, msg)
+    if blob:
+        blobs_col.insert_one(blob)
     sessions_col.update_one(
         {"session_id": session_id},
         {
@@ -116,24 +351,151 @@ def clear_messages(session_id: str) -> bool:
         {"$set": {"messages": [], "last_updated": datetime.utcnow()}},
         upsert=False,
     )
+    blobs_col.delete_many({"session_id": session_id})
     return res.matched_count > 0
 
 
-def list_sessions(limit: int = 100) -> List[Dict]:
+def _encode_session_cursor(doc: Dict) -> str:
+    raw = json.dumps([doc["last_updated"].isoformat(), doc["session_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        last_updated, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(last_updated), session_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def list_sessions(
+    limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Return recent sessions' metadata (no messages included), newest first,
+    plus the cursor of the next page (None when there are no more sessions).
+    """
+    query: Dict = {}
+    if cursor:
+        last_updated, session_id = _decode_session_cursor(cursor)
+        query = {
+            "$or": [
+                {"last_updated": {"$lt": last_updated}},
+                {"last_updated": last_updated, "session_id": {"$lt": session_id}},
+            ]
+        }
+
+    docs = list(
+        sessions_col.find(query, {"_id": 0, "session_id": 1, "name": 1, "last_updated": 1})
+        .sort([("last_updated", DESCENDING), ("session_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    next_cursor = _encode_session_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def iter_sessions(
+    after: Optional[str] = None,
+    updated_before: Optional[datetime] = None,
+    batch_size: int = DEFAULT_PAGE_SIZE,
+) -> Iterator[Dict]:
     """
-    Return recent sessions' metadata (no messages included).
+    Yield full session documents (messages expanded) ordered by session_id,
+    one at a time from a server-side cursor. Pass the last session_id seen
+    as `after` to resume an interrupted export.
     """
-    docs = (
-        sessions_col.find({}, {"_id": 0, "session_id": 1, "name": 1, "last_updated": 1})
-        .sort("last_updated", -1)
-        .limit(limit)
+    query: Dict = {}
+    if after:
+        query["session_id"] = {"$gt": after}
+    if updated_before:
+        query["last_updated"] = {"$lt": updated_before}
+
+    cursor = (
+        sessions_col.find(query, {"_id": 0})
+        .sort("session_id", ASCENDING)
+        .batch_size(batch_size)
     )
-    return list(docs)
+    for doc in cursor:
+        doc["messages"] = expand_messages(doc.get("messages", []))
+        yield doc
 
 
-# Test connection on import
-try:
-    client.admin.command('ping')
-    print(f"✅ Connected to MongoDB at {MONGO_URL}")
-except Exception as e:
-    print(f"❌ Failed to connect to MongoDB: {e}")
\ No newline at end of file
+def import_sessions(docs: List[Dict]) -> Dict[str, int]:
+    """
+    Insert a batch of exported session documents. Sessions that already exist
+    are skipped, so re-running an interrupted import is safe.
+    """
+    ids = [d["session_id"] for d in docs]
+    existing = {
+        d["session_id"]
+        for d in sessions_col.find({"session_id": {"$in": ids}}, {"_id": 0, "session_id": 1})
+    }
+
+    ops, blobs = [], []
+    for doc in docs:
+        sid = doc["session_id"]
+        if sid in existing:
+            continue
+        existing.add(sid)  # duplicates within the batch
+        messages = [
+            {k: v for k, v in m.items() if k not in ("blob_id", "size")}
+            for m in doc.get("messages", [])
+        ]
+        for msg in messages:
+            blob = _move_out_of_line(sid, msg)
+            if blob:
+                blobs.append(blob)
+        doc = {**doc, "messages": messages}
+        ops.append(UpdateOne({"session_id": sid}, {"$setOnInsert": doc}, upsert=True))
+
+    if blobs:
+        blobs_col.insert_many(blobs, ordered=False)
+    inserted = sessions_col.bulk_write(ops, ordered=False).upserted_count if ops else 0
+    return {"imported": inserted, "skipped": len(docs) - inserted}
+
+
+def delete_sessions(updated_before: datetime, batch_size: int = 500) -> int:
+    """Delete sessions (and their blobs) not updated since `updated_before`. Returns the count."""
+    deleted = 0
+    while True:
+        ids = [
+            d["session_id"]
+            for d in sessions_col.find(
+                {"last_updated": {"$lt": updated_before}}, {"_id": 0, "session_id": 1}
+            ).limit(batch_size)
+        ]
+        if not ids:
+            return deleted
+        blobs_col.delete_many({"session_id": {"$in": ids}})
+        deleted += sessions_col.delete_many({"session_id": {"$in": ids}}).deleted_count
+
+
+def ensure_indexes():
+    # Ensure index on session_id for quick lookups
+    sessions_col.create_index([("session_id", ASCENDING)], unique=True)
+    # Backs the recent-first listing and its (last_updated, session_id) cursor
+    sessions_col.create_index(
+        [("last_updated", DESCENDING), ("session_id", DESCENDING)]
+    )
+    blobs_col.create_index([("blob_id", ASCENDING)], unique=True)
+    blobs_col.create_index([("session_id", ASCENDING)])
+    routing_col.create_index([("ts", ASCENDING)], expireAfterSeconds=ROUTING_DECISIONS_TTL_S)
+    streams_col.create_index([("session_id", ASCENDING), ("done", ASCENDING)])
+    streams_col.create_index([("created_at", ASCENDING)], expireAfterSeconds=STREAM_RETENTION_S)
+    stream_events_col.create_index([("stream_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+    stream_events_col.create_index([("ts", ASCENDING)], expireAfterSeconds=STREAM_RETENTION_S)
+
+
+def init_db() -> bool:
+    """
+    Check the connection and create indexes. Meant to run in the background
+    at startup; returns False (and logs) instead of raising if Mongo is unavailable.
+    """
+    try:
+        client.admin.command("ping")
+        ensure_indexes()
+        print(f"✅ Connected to MongoDB at {MONGO_URL}")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to connect to MongoDB: {e}")
+        return False
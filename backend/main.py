@@ -1,14 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Optional
-import uuid, os
+import uuid, os, json, threading, tempfile, time, zlib
 from autocomplete import router as autocomplete_router
 import requests
 from agent_processor import stream_model
+from streaming import create_run, start_run, stream_exists, cancel_stream, sse_events
+from session_archive import export_sessions, import_archive
 
 from db import (
+    init_db,
     get_messages,
+    get_messages_page,
+    iter_messages,
+    count_messages,
     clear_messages,
     create_session,
     set_current_session,
@@ -29,13 +39,39 @@ from models_manager import (
 
 OLLAMA_API = os.getenv("OLLAMA_API", "http://localhost:11434/api/generate")
 
-app = FastAPI()
+STARTUP_RETRY_MAX_S = float(os.getenv("STARTUP_RETRY_MAX_S", "30"))
 
+_ready = threading.Event()
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize models on startup"""
+
+def background_startup():
+    """
+    Load the model state, then connect to Mongo and build indexes, retrying
+    with backoff until it succeeds. /health reports ready only after that.
+    """
+    # Local defaults apply right away; the flags sync once Mongo is reachable
     initialize_models(chat_enabled=False, auto_enabled=True)
+    delay = 1.0
+    while not init_db():
+        print(f"Retrying MongoDB connection in {delay:.0f}s")
+        time.sleep(delay)
+        delay = min(delay * 2, STARTUP_RETRY_MAX_S)
+    _ready.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing slow on the startup path: the server accepts requests right away
+    threading.Thread(target=background_startup, name="startup", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "ready": _ready.is_set()}
 
 
 class ModelStateRequest(BaseModel):
@@ -52,9 +88,9 @@ def manage_model(req: ModelStateRequest):
 
     # Update internal state FIRST
     if req.feature == "chat":
-        set_chat_enabled(req.enable)
+        shared = set_chat_enabled(req.enable)
     elif req.feature == "autocomplete":
-        set_autocomplete_enabled(req.enable)
+        shared = set_autocomplete_enabled(req.enable)
     else:
         return {"status": "error", "detail": f"Unknown feature: {req.feature}"}
 
@@ -81,6 +117,8 @@ def manage_model(req: ModelStateRequest):
         "feature": req.feature,
         "enabled": req.enable,
         "ollama_state": "loaded" if req.enable else "unloaded",
+        # False: MongoDB is unreachable, other workers get the change once it is back
+        "shared": shared,
     }
 
 
@@ -108,20 +146,49 @@ def stream_code(request: CodeRequest):
 
     memory = get_messages(sid, limit=50)
 
-    generator = stream_model(
+    run = create_run(sid)
+    events = stream_model(
         code=request.code,
         instruction=request.instruction,
         memory=memory,
         session_id=sid,
+        cancel_event=run.cancel_event,
     )
 
+    return sse_response(start_run(run, events).stream_id)
+
+
+@app.get("/stream-code/{stream_id}")
+def resume_stream_code(stream_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Reconnect to a running or recently finished /stream-code run, on any worker.
+    Events after Last-Event-ID are replayed from the run's buffer.
+    """
+    if not stream_exists(stream_id):
+        raise HTTPException(status_code=404, detail="stream not found or expired")
+    try:
+        last_id = int(last_event_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid Last-Event-ID")
+    return sse_response(stream_id, last_id)
+
+
+@app.post("/stream-code/{stream_id}/cancel")
+def cancel_stream_code(stream_id: str):
+    if not cancel_stream(stream_id, "cancelled by client"):
+        raise HTTPException(status_code=404, detail="stream not found or expired")
+    return {"status": "cancelled", "stream_id": stream_id}
+
+
+def sse_response(stream_id: str, last_event_id: int = 0) -> StreamingResponse:
     return StreamingResponse(
-        generator,
+        sse_events(stream_id, last_event_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no",
+            "X-Stream-Id": stream_id,
         },
     )
 
@@ -143,8 +210,53 @@ def create_session_endpoint(req: CreateSessionRequest):
 
 
 @app.get("/sessions")
-def list_sessions_endpoint():
-    return {"sessions": list_sessions()}
+def list_sessions_endpoint(
+    cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=500)
+):
+    try:
+        sessions, next_cursor = list_sessions(limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+
+@app.get("/sessions/export")
+def export_sessions_endpoint(
+    after: Optional[str] = None,
+    updated_before: Optional[datetime] = None,
+    compress: bool = True,
+):
+    """
+    Stream all sessions as NDJSON (gzip-compressed unless compress=false), ordered
+    by session_id. Resume an interrupted export with after=<last session_id>.
+    """
+    chunks = export_sessions(after=after, updated_before=updated_before, compress=compress)
+    filename = "sessions.ndjson.gz" if compress else "sessions.ndjson"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/sessions/import")
+async def import_sessions_endpoint(request: Request):
+    """
+    Import an archive produced by /sessions/export (gzip or plain NDJSON body).
+    Existing sessions are skipped, so a failed import can be retried as is.
+    """
+    # Spool the upload (to disk past 8 MB) instead of holding it in memory
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            totals = await run_in_threadpool(
+                import_archive, iter(lambda: spool.read(64 * 1024), b"")
+            )
+        except (ValueError, KeyError, zlib.error) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    return {"status": "ok", **totals}
 
 
 @app.get("/current-session")
@@ -187,8 +299,41 @@ def reset_session_endpoint(request: ResetRequest):
 
 
 @app.get("/session/{session_id}")
-def get_session_endpoint(session_id: str):
-    return {"session_id": session_id, "messages": get_messages(session_id=session_id)}
+def get_session_endpoint(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    expand: bool = False,
+):
+    if not session_exists(session_id):
+        raise HTTPException(status_code=404, detail="session not found")
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    messages, next_cursor = get_messages_page(
+        session_id, cursor=cursor, limit=limit, expand=expand
+    )
+    return {
+        "session_id": session_id,
+        "messages": messages,
+        "next_cursor": next_cursor,
+        "total": count_messages(session_id),
+    }
+
+
+@app.get("/session/{session_id}/stream")
+def stream_session_endpoint(session_id: str, expand: bool = False):
+    """
+    Stream the whole session history as NDJSON, one message per line.
+    Large messages are sent as previews with a `blob_id` unless expand=true.
+    """
+    if not session_exists(session_id):
+        raise HTTPException(status_code=404, detail="session not found")
+
+    def generator():
+        for msg in iter_messages(session_id, expand=expand):
+            yield json.dumps(jsonable_encoder(msg)) + "\n"
+
+    return StreamingResponse(generator(), media_type="application/x-ndjson")
 
 
 app.include_router(autocomplete_router)
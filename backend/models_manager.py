@@ -1,19 +1,129 @@
-from langchain_ollama import ChatOllama
-from typing import Optional
-import logging
+from typing import Dict, NamedTuple, Optional, TYPE_CHECKING
+import logging, os, re, threading, time
+
+from db import get_model_state, set_model_state, init_model_state
+
+if TYPE_CHECKING:
+    # langchain_ollama is imported when a model is first created
+    from langchain_ollama import ChatOllama
 
 log = logging.getLogger("model_manager")
 
 CHAT_MODEL = "mistral:7b"
 AUTO_MODEL = "qwen2.5-coder:1.5b"
 
-# Global state - models are None until enabled
-_chat_model: Optional[ChatOllama] = None
-_auto_model: Optional[ChatOllama] = None
+# The enable flags are shared by all workers through Mongo (meta collection).
+# A background thread refreshes each worker's local copy every MODEL_STATE_TTL_S
+# seconds; request handlers only read the local copy and never wait on Mongo.
+MODEL_STATE_TTL_S = float(os.getenv("MODEL_STATE_TTL_S", "1.0"))
+# While Mongo is unreachable the poll interval doubles up to this many seconds
+MODEL_STATE_MAX_BACKOFF_S = float(os.getenv("MODEL_STATE_MAX_BACKOFF_S", "30"))
+
+# Per-worker state - models are None until enabled
+_chat_model: Optional["ChatOllama"] = None
+_auto_model: Optional["ChatOllama"] = None
 
-# Feature enable flags
+# Local cache of the shared feature enable flags
 _chat_enabled = False
 _auto_enabled = False
+_poller: Optional[threading.Thread] = None
+
+# Guards the flags against a poll that read Mongo before a local toggle was saved:
+# _changes moves on every toggle, and a poll only applies what it read if it did not
+_state_lock = threading.Lock()
+_changes = 0
+_store_reachable = True
+_unsaved: Dict[str, bool] = {}  # local toggles not written to Mongo yet
+
+
+def _apply_chat_enabled(enabled: bool):
+    global _chat_enabled, _chat_model
+
+    if enabled == _chat_enabled:
+        return
+    _chat_enabled = enabled
+
+    if not enabled:
+        log.info("Disabling chat model - clearing instance")
+        _chat_model = None
+    else:
+        log.info("Enabling chat model")
+        # Model will be lazily loaded on next get_chat_model() call
+
+
+def _apply_autocomplete_enabled(enabled: bool):
+    global _auto_enabled, _auto_model
+
+    if enabled == _auto_enabled:
+        return
+    _auto_enabled = enabled
+
+    if not enabled:
+        log.info("Disabling autocomplete model - clearing instance")
+        _auto_model = None
+    else:
+        log.info("Enabling autocomplete model")
+        # Model will be lazily loaded on next get_autocomplete_model() call
+
+
+def _apply_flags(state: Dict):
+    _apply_chat_enabled(state.get("chat_enabled", _chat_enabled))
+    _apply_autocomplete_enabled(state.get("auto_enabled", _auto_enabled))
+
+
+def sync_model_state() -> bool:
+    """
+    Refresh the local flags from the shared store, first writing toggles made
+    while it was unreachable. Returns False if the store is unreachable, in
+    which case the local flags stay in effect.
+    """
+    global _store_reachable
+
+    with _state_lock:
+        seen_changes, unsaved = _changes, dict(_unsaved)
+    try:
+        if unsaved:
+            init_model_state(chat_enabled=_chat_enabled, auto_enabled=_auto_enabled)
+            set_model_state(**unsaved)
+        state = get_model_state()
+        if not state:
+            # Mongo was down when initialize_models tried to seed it
+            init_model_state(chat_enabled=_chat_enabled, auto_enabled=_auto_enabled)
+            state = get_model_state()
+    except Exception as e:
+        _store_reachable = False
+        log.warning(f"Could not read shared model state: {e}")
+        return False
+    _store_reachable = True
+
+    with _state_lock:
+        for key, value in unsaved.items():
+            if _unsaved.get(key) == value:
+                del _unsaved[key]
+        if _changes == seen_changes:
+            _apply_flags(state)
+    return True
+
+
+def _poll_model_state():
+    delay = MODEL_STATE_TTL_S
+    while True:
+        time.sleep(delay)
+        if sync_model_state():
+            delay = MODEL_STATE_TTL_S
+        else:
+            delay = min(delay * 2, MODEL_STATE_MAX_BACKOFF_S)
+
+
+def start_model_state_poller():
+    """Start the background thread keeping the local flags in sync (once per process)."""
+    global _poller
+
+    if _poller is None:
+        _poller = threading.Thread(
+            target=_poll_model_state, name="model-state", daemon=True
+        )
+        _poller.start()
 
 
 def is_chat_enabled() -> bool:
@@ -26,81 +136,165 @@ def is_autocomplete_enabled() -> bool:
     return _auto_enabled
 
 
-def get_chat_model() -> Optional[ChatOllama]:
+def get_chat_model() -> Optional["ChatOllama"]:
     """
     Get the chat model instance.
     Returns None if chat is disabled.
     """
     global _chat_model
 
-    if not _chat_enabled:
+    if not is_chat_enabled():
         return None
 
     # Lazy initialization - only create when needed
     if _chat_model is None:
+        from langchain_ollama import ChatOllama
+
         log.info(f"Initializing chat model: {CHAT_MODEL}")
         _chat_model = ChatOllama(model=CHAT_MODEL, temperature=0)
 
     return _chat_model
 
 
-def get_autocomplete_model() -> Optional[ChatOllama]:
+def get_autocomplete_model() -> Optional["ChatOllama"]:
     """
     Get the autocomplete model instance.
     Returns None if autocomplete is disabled.
     """
     global _auto_model
 
-    if not _auto_enabled:
+    if not is_autocomplete_enabled():
         return None
 
     # Lazy initialization
     if _auto_model is None:
+        from langchain_ollama import ChatOllama
+
         log.info(f"Initializing autocomplete model: {AUTO_MODEL}")
         _auto_model = ChatOllama(model=AUTO_MODEL, temperature=0.1)
 
     return _auto_model
 
 
-def set_chat_enabled(enabled: bool):
-    """
-    Enable or disable the chat model.
-    If disabling, clears the model instance.
-    """
-    global _chat_enabled, _chat_model
+def _set_flags(**flags: bool) -> bool:
+    """Apply flags locally, then share them. Returns False if Mongo could not be updated."""
+    global _changes
 
-    _chat_enabled = enabled
+    with _state_lock:
+        _changes += 1
+        _apply_flags(flags)
+    try:
+        if not _store_reachable:
+            raise ConnectionError("shared model state store is unreachable")
+        set_model_state(**flags)
+        saved = True
+    except Exception as e:
+        log.warning(f"Model flags {flags} apply to this worker only for now: {e}")
+        saved = False
+    with _state_lock:
+        # Also covers polls that started while the write was in flight
+        _changes += 1
+        if saved:
+            for key in flags:
+                _unsaved.pop(key, None)
+        else:
+            _unsaved.update(flags)
+    return saved
 
-    if not enabled:
-        log.info("Disabling chat model - clearing instance")
-        _chat_model = None
-    else:
-        log.info("Enabling chat model")
-        # Model will be lazily loaded on next get_chat_model() call
 
-
-def set_autocomplete_enabled(enabled: bool):
+def set_chat_enabled(enabled: bool) -> bool:
     """
-    Enable or disable the autocomplete model.
-    If disabling, clears the model instance.
+    Enable or disable the chat model for all workers.
+    If disabling, clears the model instance. Returns False if the change could
+    not be shared yet; it is written once Mongo is reachable again.
     """
-    global _auto_enabled, _auto_model
+    return _set_flags(chat_enabled=enabled)
 
-    _auto_enabled = enabled
 
-    if not enabled:
-        log.info("Disabling autocomplete model - clearing instance")
-        _auto_model = None
-    else:
-        log.info("Enabling autocomplete model")
-        # Model will be lazily loaded on next get_autocomplete_model() call
+def set_autocomplete_enabled(enabled: bool) -> bool:
+    """
+    Enable or disable the autocomplete model for all workers.
+    If disabling, clears the model instance. Returns False if the change could
+    not be shared yet; it is written once Mongo is reachable again.
+    """
+    return _set_flags(auto_enabled=enabled)
 
 
 def initialize_models(chat_enabled: bool = True, auto_enabled: bool = True):
     """
     Initialize model states on startup.
+    The given flags are only defaults: a worker starting next to running ones
+    picks up the shared state instead of resetting it. Until Mongo answers,
+    the defaults are used locally.
     """
-    set_chat_enabled(chat_enabled)
-    set_autocomplete_enabled(auto_enabled)
+    global _store_reachable
+
+    _apply_chat_enabled(chat_enabled)
+    _apply_autocomplete_enabled(auto_enabled)
+    try:
+        init_model_state(chat_enabled=chat_enabled, auto_enabled=auto_enabled)
+    except Exception as e:
+        _store_reachable = False
+        log.warning(f"Could not seed shared model state, using local defaults: {e}")
+    else:
+        sync_model_state()
+    start_model_state_poller()
+
+    log.info(
+        f"Model manager initialized - Chat: {_chat_enabled}, Auto: {_auto_enabled}"
+    )
+
+
+# --- Chat routing ---
+# Simple, tool-free chat requests go to the (already resident) autocomplete model;
+# everything else, and anything the small model escalates, goes to CHAT_MODEL.
+CHAT_ROUTING_ENABLED = os.getenv("CHAT_ROUTING", "1") == "1"
+# Small-route decisions scoring below this go to CHAT_MODEL. The default keeps
+# "simple task" (0.8) on the small model and sends generic "short task" (0.6)
+# requests to the large one; lower it to route those to the small model too.
+ROUTING_MIN_CONFIDENCE = float(os.getenv("CHAT_ROUTING_MIN_CONFIDENCE", "0.7"))
+SMALL_MODEL_MAX_CODE_CHARS = 2000
+SMALL_MODEL_MAX_INSTRUCTION_CHARS = 300
+
+# Requests that mention the workspace, the terminal or the web need tools
+_TOOL_HINTS = re.compile(
+    r"\b(files?|folders?|director(y|ies)|repo(sitory)?|project|codebase|run|execute|"
+    r"install|terminal|command|shell|search|google|web|url|https?|fetch|download|"
+    r"read|open|create|write|save|delete|edit|tests?)\b",
+    re.IGNORECASE,
+)
+# Small, local edits and explanations of the given snippet
+_SIMPLE_HINTS = re.compile(
+    r"\b(rename|what does|what is|explain|comment|docstring|typo|format|type hints?|"
+    r"simplify|one-liner|regex|convert|translate|fix (the )?syntax)\b",
+    re.IGNORECASE,
+)
+
+
+class RouteDecision(NamedTuple):
+    model: str  # "small" or "large"
+    reason: str
+    confidence: float  # confidence that the small model can handle it
+
+
+def route_chat_request(instruction: str, code: str = "") -> RouteDecision:
+    """Cheap heuristic deciding which model should answer a chat request."""
+    if not CHAT_ROUTING_ENABLED:
+        return RouteDecision("large", "routing disabled", 0.0)
+    if not is_autocomplete_enabled():
+        return RouteDecision("large", "small model not loaded", 0.0)
+    if _TOOL_HINTS.search(instruction):
+        return RouteDecision("large", "needs tools", 0.1)
+    if len(code) > SMALL_MODEL_MAX_CODE_CHARS:
+        return RouteDecision("large", "large code context", 0.3)
+    if len(instruction) > SMALL_MODEL_MAX_INSTRUCTION_CHARS:
+        return RouteDecision("large", "long instruction", 0.4)
+
+    if _SIMPLE_HINTS.search(instruction):
+        decision = RouteDecision("small", "simple task", 0.8)
+    else:
+        decision = RouteDecision("small", "short task", 0.6)
 
-    log.info(f"Model manager initialized - Chat: {chat_enabled}, Auto: {auto_enabled}")
+    if decision.confidence < ROUTING_MIN_CONFIDENCE:
+        return decision._replace(model="large", reason=f"low confidence ({decision.reason})")
+    return decision
@@ -0,0 +1,140 @@
+"""
+Session archives: one JSON session document per line (NDJSON), gzip-compressed
+by default. Both directions work incrementally, so memory stays bounded by one
+session plus one import batch regardless of the archive size.
+"""
+
+import json
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from db import iter_sessions, import_sessions
+
+IMPORT_BATCH_SIZE = 200
+_DATE_FIELDS = ("created_at", "last_updated")
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _to_json(doc: Dict) -> str:
+    doc = {
+        k: v.isoformat() if isinstance(v, datetime) else v for k, v in doc.items()
+    }
+    return json.dumps(doc, ensure_ascii=False)
+
+
+def _from_json(line: str) -> Dict:
+    doc = json.loads(line)
+    for field in _DATE_FIELDS:
+        if isinstance(doc.get(field), str):
+            doc[field] = datetime.fromisoformat(doc[field])
+    return doc
+
+
+def export_sessions(
+    after: Optional[str] = None,
+    updated_before: Optional[datetime] = None,
+    compress: bool = True,
+) -> Iterator[bytes]:
+    """Yield the archive as byte chunks, one chunk per session (compressed as it goes)."""
+    gzip = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    for doc in iter_sessions(after=after, updated_before=updated_before):
+        data = (_to_json(doc) + "\n").encode("utf-8")
+        if gzip:
+            data = gzip.compress(data)
+        if data:
+            yield data
+    if gzip:
+        yield gzip.flush()
+
+
+class ArchiveReader:
+    """
+    Incremental archive parser: feed() byte chunks in, get session documents out.
+    Gzip is detected from the first bytes (concatenated gzip members are read
+    one after the other); plain NDJSON is accepted too. After close(),
+    `truncated` tells whether the archive ended mid-stream or mid-line.
+    """
+
+    def __init__(self):
+        self._decompressor = None
+        self._started = False
+        self._buffer = b""
+        self.truncated = False
+
+    def _inflate(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            if self._decompressor.eof:
+                # `cat a.gz b.gz` is a valid gzip file: start on the next member
+                self._decompressor = zlib.decompressobj(wbits=31)
+            out.append(self._decompressor.decompress(data))
+            data = self._decompressor.unused_data
+        return b"".join(out)
+
+    def feed(self, chunk: bytes) -> List[Dict]:
+        if not self._started:
+            self._buffer += chunk
+            if len(self._buffer) < 2:
+                return []
+            self._started = True
+            chunk, self._buffer = self._buffer, b""
+            if chunk.startswith(_GZIP_MAGIC):
+                self._decompressor = zlib.decompressobj(wbits=31)
+
+        if self._decompressor:
+            chunk = self._inflate(chunk)
+        self._buffer += chunk
+
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [_from_json(line.decode("utf-8")) for line in lines if line.strip()]
+
+    def close(self) -> List[Dict]:
+        """Parse what is left. An incomplete last line is dropped and flagged, not raised."""
+        rest = self._buffer
+        if self._decompressor:
+            rest += self._decompressor.flush()
+            self.truncated = not self._decompressor.eof
+        self._buffer = b""
+
+        *lines, tail = rest.split(b"\n")
+        docs = [_from_json(line.decode("utf-8")) for line in lines if line.strip()]
+        if tail.strip():
+            # Archives end with a newline, so this is a cut-off line unless it parses
+            try:
+                docs.append(_from_json(tail.decode("utf-8")))
+            except ValueError:
+                self.truncated = True
+        return docs
+
+
+def import_archive(chunks: Iterable[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Import an archive from byte chunks in batches. Existing sessions are skipped,
+    so an interrupted import can simply be run again. If the archive is cut
+    off, everything before the damaged tail is imported and "truncated" is set.
+    """
+    totals = {"imported": 0, "skipped": 0, "last_session_id": None, "truncated": False}
+    reader = ArchiveReader()
+    batch: List[Dict] = []
+
+    def flush():
+        result = import_sessions(batch)
+        totals["imported"] += result["imported"]
+        totals["skipped"] += result["skipped"]
+        totals["last_session_id"] = batch[-1]["session_id"]
+        batch.clear()
+
+    for chunk in chunks:
+        for doc in reader.feed(chunk):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                flush()
+    # Store the complete documents before looking at a possibly damaged tail
+    if batch:
+        flush()
+    batch.extend(reader.close())
+    if batch:
+        flush()
+    totals["truncated"] = reader.truncated
+    return totals
@@ -0,0 +1,367 @@
+"""
+Server-sent events for agent runs.
+
+An agent run executes in a background thread and publishes typed events
+(token, tool_start, tool_output, error, cancelled, done) into a StreamRun. Tokens are
+coalesced into frames by size/time, and the last REPLAY_MAX_EVENTS events are
+kept so a client can reconnect with Last-Event-ID and resume without
+re-running the agent.
+
+A run is driven by the worker that started it, but its events are also written
+to Mongo, so a resume that lands on another uvicorn worker is served from
+there. Cancel requests and the per-session supersede are flags on the stream's
+Mongo document, which each worker polls for its own runs.
+
+A run is cancelled (run.cancel_event is set) when its last reader has been
+gone for DISCONNECT_GRACE_S, when the client cancels it explicitly, or when a
+new run starts for the same session.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, Iterable, List, Optional, Tuple
+
+from db import (
+    append_stream_events,
+    get_stream,
+    get_stream_cancel_requests,
+    get_stream_events,
+    register_stream,
+    request_stream_cancel,
+    stream_read_since,
+)
+
+log = logging.getLogger("streaming")
+
+# A token frame is flushed once it holds this many chars or is this old
+COALESCE_MAX_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", "64"))
+COALESCE_MAX_DELAY_S = float(os.getenv("STREAM_COALESCE_DELAY_S", "0.05"))
+# Events kept per run for replay, and how long finished runs stay resumable
+REPLAY_MAX_EVENTS = int(os.getenv("STREAM_REPLAY_EVENTS", "2000"))
+REPLAY_TTL_S = float(os.getenv("STREAM_REPLAY_TTL_S", "300"))
+# How long a run without readers keeps going, waiting for a reconnect
+DISCONNECT_GRACE_S = float(os.getenv("STREAM_DISCONNECT_GRACE_S", "10"))
+HEARTBEAT_S = 15.0
+# How often workers check Mongo for cancel requests and readers poll other workers' events
+CONTROL_POLL_S = float(os.getenv("STREAM_CONTROL_POLL_S", "0.5"))
+REMOTE_POLL_S = float(os.getenv("STREAM_REMOTE_POLL_S", "0.2"))
+RETRY_MS = 2000
+
+Event = Tuple[int, str, Dict]  # (id, event type, payload)
+
+
+def format_sse(event_id: Optional[int], event: str, data: Dict) -> str:
+    """Frame one event. Payloads are JSON so newlines in text are escaped."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StreamRun:
+    """Event buffer of one agent run, shared by the producer thread and SSE readers."""
+
+    def __init__(self, session_id: str):
+        self.stream_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.events: Deque[Event] = deque(maxlen=REPLAY_MAX_EVENTS)
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+        self._next_id = 1
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._pending_since = 0.0
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        # Events not yet written to Mongo; mirroring stops after the first failure
+        self._unsynced: List[Event] = []
+        self._sync_lock = threading.Lock()
+        self._mirrored = True
+
+    def cancel(self, reason: str):
+        if not self.done and not self.cancel_event.is_set():
+            log.info(f"Cancelling stream {self.stream_id}: {reason}")
+            self.cancel_event.set()
+
+    # --- producer side ---
+    def publish_token(self, text: str):
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(text)
+            self._pending_chars += len(text)
+            if self._pending_chars >= COALESCE_MAX_CHARS or self._pending_stale():
+                self._flush_locked()
+        self._mirror()
+
+    def publish(self, event: str, data: Dict):
+        with self._lock:
+            self._flush_locked()
+            self._append_locked(event, data)
+        self._mirror()
+
+    def finish(self):
+        with self._lock:
+            self._flush_locked()
+            self._append_locked("done", {})
+            self.done = True
+            self.finished_at = time.monotonic()
+        self._mirror()
+
+    def _mirror(self):
+        """Write new events to Mongo for readers on other workers (producer thread only)."""
+        with self._sync_lock:
+            with self._lock:
+                events, self._unsynced = self._unsynced, []
+            if not events or not self._mirrored:
+                return
+            try:
+                append_stream_events(self.stream_id, events)
+            except Exception as e:
+                log.warning(f"Stream {self.stream_id} is only resumable on this worker: {e}")
+                self._mirrored = False
+
+    def _pending_stale(self) -> bool:
+        return time.monotonic() - self._pending_since >= COALESCE_MAX_DELAY_S
+
+    def _flush_locked(self):
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending, self._pending_chars = [], 0
+            self._append_locked("token", {"text": text})
+
+    def _append_locked(self, event: str, data: Dict):
+        self.events.append((self._next_id, event, data))
+        self._unsynced.append((self._next_id, event, data))
+        self._next_id += 1
+        for loop, wake in self._waiters:
+            loop.call_soon_threadsafe(wake.set)
+
+    # --- consumer side ---
+    def events_after(self, last_id: int) -> Tuple[List[Event], bool]:
+        """Return buffered events with id > last_id and whether the run is finished."""
+        with self._lock:
+            if self._pending and self._pending_stale():
+                self._flush_locked()
+            return [e for e in self.events if e[0] > last_id], self.done
+
+    def first_buffered_id(self) -> int:
+        with self._lock:
+            return self.events[0][0] if self.events else self._next_id
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            return bool(self._pending)
+
+    def add_waiter(self, loop: asyncio.AbstractEventLoop, wake: asyncio.Event):
+        with self._lock:
+            self._waiters.append((loop, wake))
+
+    def remove_waiter(self, loop: asyncio.AbstractEventLoop, wake: asyncio.Event):
+        with self._lock:
+            self._waiters.remove((loop, wake))
+            abandoned = not self._waiters and not self.done
+        if abandoned:
+            timer = threading.Timer(DISCONNECT_GRACE_S, self._cancel_if_abandoned)
+            timer.daemon = True
+            timer.start()
+
+    def _cancel_if_abandoned(self):
+        with self._lock:
+            abandoned = not self._waiters and not self.done
+        if not abandoned:
+            return
+        try:
+            remote_reader = stream_read_since(self.stream_id, DISCONNECT_GRACE_S)
+        except Exception:
+            remote_reader = False
+        if remote_reader:
+            # The client reconnected to another worker; check again later
+            timer = threading.Timer(DISCONNECT_GRACE_S, self._cancel_if_abandoned)
+            timer.daemon = True
+            timer.start()
+        else:
+            self.cancel("client disconnected")
+
+
+_runs: Dict[str, StreamRun] = {}
+_runs_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+
+
+def _evict_expired():
+    now = time.monotonic()
+    with _runs_lock:
+        for sid, run in list(_runs.items()):
+            if run.done and now - run.finished_at > REPLAY_TTL_S:
+                del _runs[sid]
+
+
+def _drive(run: StreamRun, events: Iterable[Tuple[str, Dict]]):
+    try:
+        for event, data in events:
+            if event == "token":
+                run.publish_token(data["text"])
+            else:
+                run.publish(event, data)
+    except Exception as e:
+        log.exception(f"Stream {run.stream_id} failed")
+        run.publish("error", {"message": f"[Stream error] {type(e).__name__}: {e}"})
+    finally:
+        run.finish()
+
+
+def _watch_cancel_requests():
+    """Apply cancel requests stored in Mongo (by other workers) to this worker's runs."""
+    while True:
+        time.sleep(CONTROL_POLL_S)
+        with _runs_lock:
+            active = {sid: run for sid, run in _runs.items() if not run.done}
+        if not active:
+            continue
+        try:
+            reasons = get_stream_cancel_requests(list(active))
+        except Exception as e:
+            log.warning(f"Could not read stream cancel requests: {e}")
+            time.sleep(DISCONNECT_GRACE_S)
+            continue
+        for stream_id, reason in reasons.items():
+            active[stream_id].cancel(reason)
+
+
+def create_run(session_id: str) -> StreamRun:
+    """
+    Register a new run for a session. A run still going for the same session,
+    on any worker, is cancelled: the user asked something else.
+    """
+    global _watcher
+
+    _evict_expired()
+    run = StreamRun(session_id)
+    with _runs_lock:
+        previous = [r for r in _runs.values() if r.session_id == session_id]
+        _runs[run.stream_id] = run
+        if _watcher is None:
+            _watcher = threading.Thread(
+                target=_watch_cancel_requests, name="stream-cancel-watcher", daemon=True
+            )
+            _watcher.start()
+    for other in previous:
+        other.cancel("superseded by a new request")
+    try:
+        register_stream(run.stream_id, session_id)
+    except Exception as e:
+        log.warning(f"Stream {run.stream_id} is only visible to this worker: {e}")
+        run._mirrored = False
+    return run
+
+
+def start_run(run: StreamRun, events: Iterable[Tuple[str, Dict]]) -> StreamRun:
+    """Consume `events` (e.g. stream_model(...)) in a background thread."""
+    threading.Thread(
+        target=_drive, args=(run, events), name=f"stream-{run.stream_id}", daemon=True
+    ).start()
+    return run
+
+
+def get_run(stream_id: str) -> Optional[StreamRun]:
+    """The run if it was started by this worker."""
+    _evict_expired()
+    with _runs_lock:
+        return _runs.get(stream_id)
+
+
+def stream_exists(stream_id: str) -> bool:
+    """True if the stream can be read here, from this worker or through Mongo."""
+    if get_run(stream_id) is not None:
+        return True
+    try:
+        return get_stream(stream_id) is not None
+    except Exception as e:
+        log.warning(f"Could not look up stream {stream_id}: {e}")
+        return False
+
+
+def cancel_stream(stream_id: str, reason: str) -> bool:
+    """Cancel a stream on whichever worker runs it. Returns False if it is unknown."""
+    run = get_run(stream_id)
+    if run is not None:
+        run.cancel(reason)
+        return True
+    try:
+        return request_stream_cancel(stream_id, reason)
+    except Exception as e:
+        log.warning(f"Could not request cancel of stream {stream_id}: {e}")
+        return False
+
+
+async def sse_events(stream_id: str, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+    """Yield SSE frames of a stream after `last_event_id` until it is done."""
+    run = get_run(stream_id)
+    if run and last_event_id and run.first_buffered_id() > last_event_id + 1 and run._mirrored:
+        run = None  # past the replay buffer, Mongo still has the events
+    source = _local_events(run, last_event_id) if run else _remote_events(stream_id, last_event_id)
+    async for frame in source:
+        yield frame
+
+
+async def _remote_events(stream_id: str, last_event_id: int) -> AsyncGenerator[str, None]:
+    """Follow a stream run by another worker through its events in Mongo."""
+    yield f"retry: {RETRY_MS}\n\n"
+
+    idle = 0.0
+    while True:
+        try:
+            events = await asyncio.to_thread(get_stream_events, stream_id, last_event_id)
+        except Exception as e:
+            yield format_sse(None, "error", {"message": f"[Stream error] {type(e).__name__}: {e}"})
+            return
+        for event_id, event, data in events:
+            yield format_sse(event_id, event, data)
+            last_event_id = event_id
+            if event == "done":
+                return
+
+        idle = 0.0 if events else idle + REMOTE_POLL_S
+        if idle >= HEARTBEAT_S:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(REMOTE_POLL_S)
+
+
+async def _local_events(run: StreamRun, last_event_id: int) -> AsyncGenerator[str, None]:
+    yield f"retry: {RETRY_MS}\n\n"
+
+    if last_event_id and run.first_buffered_id() > last_event_id + 1:
+        yield format_sse(
+            None, "error", {"message": "Replay window exceeded, some output was lost."}
+        )
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    run.add_waiter(loop, wake)
+    try:
+        while True:
+            wake.clear()
+            events, done = run.events_after(last_event_id)
+            for event_id, event, data in events:
+                yield format_sse(event_id, event, data)
+                last_event_id = event_id
+            if done:
+                return
+
+            # Wake up for new events, to flush a pending token frame, or to keep the connection alive
+            timeout = COALESCE_MAX_DELAY_S if run.has_pending() else HEARTBEAT_S
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if not run.has_pending():
+                    yield ": keep-alive\n\n"
+    finally:
+        run.remove_waiter(loop, wake)
@@ -1,12 +1,17 @@
-from .fs_tools import list_files_tool, read_file_tool, write_file_tool
+from .fs_tools import list_files_tool, read_file_tool, write_file_tool, edit_file_tool
+from .tree_tools import project_tree_tool
 from .terminal_tools import run_terminal_command
 from .web_tools import fetch_website_text, web_search
+from .output_store import read_tool_output, bound_tool_output
 
 TOOLS = {
     "list_files_tool": list_files_tool,
+    "project_tree_tool": project_tree_tool,
     "read_file_tool": read_file_tool,
     "write_file_tool": write_file_tool,
+    "edit_file_tool": edit_file_tool,
     "run_terminal_command": run_terminal_command,
     "fetch_website_text": fetch_website_text,
     "web_search": web_search,
+    "read_tool_output": read_tool_output,
 }
@@ -1,11 +1,47 @@
+import difflib
 import os
-from typing import List
+import tempfile
+from typing import Dict, List, Optional, Tuple
 
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
 BASE_DIR = os.path.abspath(".")
 
+# Minimum similarity for a fuzzy anchor match in edit_file
+FUZZY_MATCH_THRESHOLD = 0.85
+# At most this many candidate windows are scored in a fuzzy search; beyond that
+# the block is reported as not found
+MAX_FUZZY_WINDOWS = 5000
+
+
+def _current_umask() -> int:
+    # The umask can only be read by setting it; restore it right away
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def _atomic_write(full_path: str, content: str):
+    """Write via a temp file in the same directory + rename, so readers never see a partial file."""
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(full_path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        if os.path.exists(full_path):
+            os.chmod(tmp_path, os.stat(full_path).st_mode)
+        else:
+            # mkstemp creates 0600; give new files the mode open() would
+            os.chmod(tmp_path, 0o666 & ~_current_umask())
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
 class ListFilesInput(BaseModel):
     path: str = Field(".", description="Directory path relative to project root")
@@ -49,10 +85,259 @@ class WriteFileInput(BaseModel):
 def write_file_tool(path: str, content: str) -> str:
     """Write content to a file (overwrite)."""
     full_path = os.path.join(BASE_DIR, path)
-    os.makedirs(os.path.dirname(full_path), exist_ok=True)
     try:
-        with open(full_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        _atomic_write(full_path, content)
         return f"File {path} written successfully"
     except Exception as e:
         return f"Error writing file {path}: {str(e)}"
+
+
+class EditBlock(BaseModel):
+    search: str = Field(..., description="Existing lines to replace, copied from the file")
+    replace: str = Field(..., description="New lines to put in their place")
+
+
+class EditFileInput(BaseModel):
+    path: str = Field(..., description="File path relative to project root")
+    edits: List[EditBlock] = Field(
+        default_factory=list, description="Search/replace blocks, applied in order"
+    )
+    diff: Optional[str] = Field(
+        None, description="Unified diff of the file (alternative to edits)"
+    )
+
+
+def _parse_unified_diff(diff: str) -> List[Tuple[str, str]]:
+    """Turn each hunk of a unified diff into a (search, replace) pair."""
+    hunks: List[Tuple[List[str], List[str]]] = []
+    old: List[str] = []
+    new: List[str] = []
+    in_hunk = False
+    for line in diff.splitlines():
+        if line.startswith("@@"):
+            if old or new:
+                hunks.append((old, new))
+            old, new, in_hunk = [], [], True
+        elif not in_hunk or line.startswith("\\"):
+            continue  # file headers, "\ No newline at end of file"
+        elif line.startswith("-"):
+            old.append(line[1:])
+        elif line.startswith("+"):
+            new.append(line[1:])
+        else:
+            # Context line; models often drop the leading space of blank lines
+            old.append(line[1:] if line.startswith(" ") else line)
+            new.append(line[1:] if line.startswith(" ") else line)
+    if old or new:
+        hunks.append((old, new))
+    return [("\n".join(o), "\n".join(n)) for o, n in hunks]
+
+
+def _find_anchor(lines: List[str], search: List[str]) -> Optional[Tuple[int, bool]]:
+    """
+    Find where `search` starts in `lines`. Tries an exact match, then one ignoring
+    surrounding whitespace, then the most similar window above FUZZY_MATCH_THRESHOLD.
+    Returns (start line, fuzzy) or None.
+    """
+    n = len(search)
+    windows = range(len(lines) - n + 1)
+
+    for normalize in (lambda l: l, str.strip):
+        target = [normalize(l) for l in search]
+        matches = [i for i in windows if [normalize(l) for l in lines[i : i + n]] == target]
+        if len(matches) == 1:
+            return matches[0], normalize is str.strip
+        if len(matches) > 1:
+            return None  # ambiguous, the model has to add context
+
+    target = [l.strip() for l in search]
+    stripped = [l.strip() for l in lines]
+
+    # Windows in which some search line matches exactly, at the right offset, are
+    # the candidates; only if there are none is every window considered
+    offsets: Dict[str, List[int]] = {}
+    for k, t in enumerate(target):
+        if t:
+            offsets.setdefault(t, []).append(k)
+    candidates = sorted(
+        {
+            i - k
+            for i, line in enumerate(stripped)
+            for k in offsets.get(line, ())
+            if i - k in windows
+        }
+    )
+    if not candidates:
+        candidates = list(windows)
+    if len(candidates) > MAX_FUZZY_WINDOWS:
+        return None
+
+    # Score a window by the mean similarity of its lines to the search lines.
+    # A window is dropped as soon as it can no longer reach the threshold, and
+    # the cheap upper bounds are tried before the real ratio.
+    matchers = [difflib.SequenceMatcher(None, autojunk=False) for _ in target]
+    for m, t in zip(matchers, target):
+        m.set_seq2(t)  # seq2 is the side SequenceMatcher caches
+    needed = FUZZY_MATCH_THRESHOLD * n
+
+    scored = []
+    for i in candidates:
+        total = 0.0
+        for k, m in enumerate(matchers):
+            line = stripped[i + k]
+            if line == target[k]:
+                total += 1.0
+                continue
+            best_rest = n - k - 1
+            m.set_seq1(line)
+            if total + m.real_quick_ratio() + best_rest < needed:
+                break
+            if total + m.quick_ratio() + best_rest < needed:
+                break
+            total += m.ratio()
+            if total + best_rest < needed:
+                break
+        else:
+            scored.append((total / n, i))
+    scored.sort(reverse=True)
+    # The best window has to clearly win, otherwise the match is ambiguous
+    if not scored or (len(scored) > 1 and scored[0][0] - scored[1][0] < 0.02):
+        return None
+    return scored[0][1], True
+
+
+def _indent(line: str) -> str:
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _reindent(found: List[str], search: List[str], replace: List[str]) -> Optional[List[str]]:
+    """
+    Map the indentation levels of `search` onto the ones of the matched `found`
+    lines and apply the mapping to `replace`. Returns None if the search block's
+    relative indentation does not agree with the file.
+    """
+    levels: Dict[str, str] = {}
+    for given_line, found_line in zip(search, found):
+        if given_line.strip() and found_line.strip():
+            given, actual = _indent(given_line), _indent(found_line)
+            if levels.setdefault(given, actual) != actual:
+                return None
+    # Deeper in the search block has to be deeper in the file too
+    given_levels = sorted(levels, key=len)
+    ordered = [levels[g] for g in given_levels]
+    if any(len(a) >= len(b) for a, b in zip(ordered, ordered[1:])):
+        return None
+    scale = None
+    if len(given_levels) > 1:
+        given_step = len(given_levels[1]) - len(given_levels[0])
+        scale = (len(ordered[1]) - len(ordered[0])) / given_step
+
+    result = []
+    for line in replace:
+        given = _indent(line)
+        if not line.strip() or given in levels:
+            result.append(levels.get(given, given) + line[len(given) :])
+            continue
+        # A level the search block does not have: extend the closest shallower one,
+        # converting the extra indentation to the file's indent width
+        bases = [g for g in levels if given.startswith(g)]
+        if not bases:
+            return None
+        base = max(bases, key=len)
+        extra = given[len(base) :]
+        if scale and not extra.strip(" "):
+            extra = " " * round(len(extra) * scale)
+        result.append(levels[base] + extra + line[len(given) :])
+    return result
+
+
+def _apply_block(text: str, search: str, replace: str) -> Optional[Tuple[str, bool]]:
+    """Apply one search/replace block. Returns (new text, fuzzy) or None if not located."""
+    if not search.strip():
+        return None
+    if text.count(search) == 1:
+        return text.replace(search, replace, 1), False
+
+    lines = text.split("\n")
+    search_lines = search.strip("\n").split("\n")
+    replace_lines = replace.strip("\n").split("\n") if replace.strip("\n") else []
+    anchor = _find_anchor(lines, search_lines)
+    if anchor is None:
+        return None
+    start, fuzzy = anchor
+
+    if fuzzy and replace_lines:
+        # Shift the replacement to the indentation actually found in the file
+        found = lines[start : start + len(search_lines)]
+        replace_lines = _reindent(found, search_lines, replace_lines)
+        if replace_lines is None:
+            return None
+
+    lines[start : start + len(search_lines)] = replace_lines
+    return "\n".join(lines), fuzzy
+
+
+@tool("edit_file", args_schema=EditFileInput, return_direct=False)
+def edit_file_tool(
+    path: str, edits: Optional[List[EditBlock]] = None, diff: Optional[str] = None
+) -> str:
+    """Edit part of a file with search/replace blocks or a unified diff (prefer this over write_file for existing files)."""
+    full_path = os.path.join(BASE_DIR, path)
+    if not os.path.exists(full_path):
+        return f"File not found: {path}"
+
+    blocks = [
+        (e.search, e.replace) if isinstance(e, EditBlock) else (e["search"], e["replace"])
+        for e in edits or []
+    ]
+    if diff:
+        blocks.extend(_parse_unified_diff(diff))
+    if not blocks:
+        return "No edits given: pass `edits` (search/replace blocks) or a unified `diff`."
+
+    try:
+        with open(full_path, "r", encoding="utf-8", newline="") as f:
+            original = f.read()
+    except Exception as e:
+        return f"Error reading file {path}: {str(e)}"
+
+    crlf = "\r\n" in original
+    text = original.replace("\r\n", "\n")
+
+    fuzzy = 0
+    failed = []
+    for idx, (search, replace) in enumerate(blocks, 1):
+        result = _apply_block(text, search, replace)
+        if result is None:
+            failed.append(idx)
+            continue
+        text, was_fuzzy = result
+        fuzzy += was_fuzzy
+
+    if failed:
+        # All or nothing: a partially applied edit is harder to recover from
+        return (
+            f"No changes made to {path}: could not locate block(s) {failed} "
+            "(not found or ambiguous). Copy the search text exactly from the file "
+            "and include enough surrounding lines to make it unique."
+        )
+
+    content = text.replace("\n", "\r\n") if crlf else text
+    try:
+        _atomic_write(full_path, content)
+    except Exception as e:
+        return f"Error writing file {path}: {str(e)}"
+
+    added = removed = 0
+    matcher = difflib.SequenceMatcher(
+        None, original.replace("\r\n", "\n").split("\n"), text.split("\n"), autojunk=False
+    )
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op != "equal":
+            removed += i2 - i1
+            added += j2 - j1
+
+    summary = f"Edited {path}: {len(blocks)} block(s) applied, +{added}/-{removed} lines"
+    if fuzzy:
+        summary += f" ({fuzzy} matched approximately)"
+    return summary
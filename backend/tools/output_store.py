@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+from typing import Dict, Optional
+
+from langchain_core.tools import tool
+from pydantic import BaseModel, Field
+
+log = logging.getLogger("output_store")
+
+# Large tool outputs are written here; the model only gets a preview and a handle
+TOOL_OUTPUT_DIR = os.getenv(
+    "TOOL_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "coding-agent-tool-outputs")
+)
+SPILL_TTL_S = float(os.getenv("TOOL_OUTPUT_TTL_S", "3600"))
+
+# Rough token estimate, good enough for budgeting prompt size
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = int(os.getenv("TOOL_OUTPUT_TOKEN_BUDGET", "1000"))
+# Per-tool budgets in tokens; None means the output is never spilled
+TOKEN_BUDGETS: Dict[str, Optional[int]] = {
+    "read_file": 2000,
+    "project_tree": 1500,
+    "run_terminal_command": 1000,
+    "fetch_website_text": 1000,
+    "read_tool_output": None,  # pages are already bounded by MAX_PAGE_CHARS
+}
+MAX_PAGE_CHARS = 8000
+
+_HANDLE_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _path(handle: str) -> str:
+    return os.path.join(TOOL_OUTPUT_DIR, f"{handle}.txt")
+
+
+def _remove_expired():
+    now = time.time()
+    try:
+        with os.scandir(TOOL_OUTPUT_DIR) as it:
+            for entry in it:
+                if now - entry.stat().st_mtime > SPILL_TTL_S:
+                    os.unlink(entry.path)
+    except OSError:
+        pass
+
+
+def spill(content: str) -> str:
+    """Store `content` on disk and return its handle."""
+    # Outputs can contain file contents and command output: keep them private
+    os.makedirs(TOOL_OUTPUT_DIR, mode=0o700, exist_ok=True)
+    os.chmod(TOOL_OUTPUT_DIR, 0o700)
+    _remove_expired()
+    handle = uuid.uuid4().hex
+    fd = os.open(_path(handle), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+    except OSError:
+        os.unlink(_path(handle))  # don't leave a partial output behind
+        raise
+    return handle
+
+
+def bound_tool_output(tool_name: str, content: str) -> str:
+    """
+    Return `content` unchanged if it fits the tool's token budget, otherwise
+    spill it and return a preview with a handle for read_tool_output.
+    """
+    budget = TOKEN_BUDGETS.get(tool_name, DEFAULT_TOKEN_BUDGET)
+    if budget is None or len(content) <= budget * CHARS_PER_TOKEN:
+        return content
+
+    preview = content[: budget * CHARS_PER_TOKEN]
+    # End the preview on a line boundary when there is one reasonably close
+    cut = preview.rfind("\n")
+    if cut > len(preview) // 2:
+        preview = preview[: cut + 1]
+
+    try:
+        handle = spill(content)
+    except OSError as e:
+        # e.g. the spill dir belongs to another user or the disk is full
+        log.warning(f"Could not store {tool_name} output: {e}")
+        return (
+            f"{preview}\n\n[Output truncated: showing {len(preview)} of {len(content)} chars. "
+            "The rest could not be stored; narrow the request to see more.]"
+        )
+    return (
+        f"{preview}\n\n[Output truncated: showing {len(preview)} of {len(content)} chars. "
+        f'Read more with read_tool_output(handle="{handle}", offset={len(preview)})]'
+    )
+
+
+class ReadToolOutputInput(BaseModel):
+    handle: str = Field(..., description="Handle from a truncated tool output")
+    offset: int = Field(0, description="Character offset to start reading from")
+    limit: int = Field(4000, description=f"Number of characters to read (max {MAX_PAGE_CHARS})")
+
+
+@tool("read_tool_output", args_schema=ReadToolOutputInput, return_direct=False)
+def read_tool_output(handle: str, offset: int = 0, limit: int = 4000) -> str:
+    """Read more of a truncated tool output by its handle, one page at a time."""
+    if not _HANDLE_RE.match(handle):
+        return f"Invalid handle: {handle}"
+    try:
+        with open(_path(handle), "r", encoding="utf-8") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return f"Output {handle} not found or expired. Run the original tool again."
+    except Exception as e:
+        return f"Error reading output {handle}: {str(e)}"
+
+    offset = max(0, offset)
+    end = min(len(content), offset + max(1, min(limit, MAX_PAGE_CHARS)))
+    page = content[offset:end]
+    if end < len(content):
+        return f"{page}\n\n[chars {offset}-{end} of {len(content)}; next offset={end}]"
+    return f"{page}\n\n[chars {offset}-{end} of {len(content)}; end of output]"
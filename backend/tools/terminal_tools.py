@@ -1,9 +1,25 @@
+import os
+import signal
 import subprocess
-from langchain.tools import tool
+import time
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+
+COMMAND_TIMEOUT_S = 10
+POLL_INTERVAL_S = 0.2
+
+
+def _kill_process_group(proc: subprocess.Popen):
+    """Kill the shell and everything it started, then reap it."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.communicate()
 
 
 @tool("run_terminal_command", return_direct=False)
-def run_terminal_command(command: str) -> str:
+def run_terminal_command(command: str, config: RunnableConfig) -> str:
     """
     Execute a Linux terminal command and return its output.
 
@@ -13,19 +29,33 @@ def run_terminal_command(command: str) -> str:
     Returns:
         str: The standard output or error message from the command.
     """
+    cancel_event = config.get("configurable", {}).get("cancel_event")
     try:
-        result = subprocess.run(
+        # Own process group, so a timeout or cancellation kills the whole pipeline
+        proc = subprocess.Popen(
             command,
             shell=True,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=10,  # Prevents hanging processes
+            start_new_session=True,
         )
-        if result.returncode == 0:
-            return result.stdout.strip()
+        deadline = time.monotonic() + COMMAND_TIMEOUT_S
+        while True:
+            try:
+                stdout, stderr = proc.communicate(timeout=POLL_INTERVAL_S)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_event is not None and cancel_event.is_set():
+                    _kill_process_group(proc)
+                    return "[Cancelled] Command was stopped."
+                if time.monotonic() >= deadline:  # Prevents hanging processes
+                    _kill_process_group(proc)
+                    return f"[Error] Command timed out after {COMMAND_TIMEOUT_S} seconds."
+
+        if proc.returncode == 0:
+            return stdout.strip()
         else:
-            return f"[Error] Command failed:\n{result.stderr.strip()}"
-    except subprocess.TimeoutExpired:
-        return "[Error] Command timed out after 10 seconds."
+            return f"[Error] Command failed:\n{stderr.strip()}"
     except Exception as e:
         return f"[Exception] {e}"
@@ -0,0 +1,228 @@
+import fnmatch
+import os
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.tools import tool
+from pydantic import BaseModel, Field
+
+from .fs_tools import BASE_DIR
+
+# Never worth showing to the model, ignored or not
+VENDOR_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    "node_modules",
+    "__pycache__",
+    ".venv",
+    "venv",
+    ".tox",
+    ".nox",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    ".idea",
+    ".vscode",
+    ".next",
+    "dist",
+    "build",
+    "target",
+    "vendor",
+}
+
+MAX_CACHED_TREES = 32
+
+# (path, max_depth, max_entries) -> (mtimes of the dirs, .gitignores and files read, rendered tree)
+_tree_cache: Dict[Tuple[str, int, int], Tuple[Dict[str, int], str]] = {}
+
+
+class GitIgnore:
+    """Subset of .gitignore semantics: globs, negation, dir-only and anchored patterns."""
+
+    def __init__(self):
+        # (directory of the .gitignore, pattern, negate, dir_only, anchored)
+        self.rules: List[Tuple[str, str, bool, bool, bool]] = []
+
+    def load(self, directory: str) -> Optional[str]:
+        """Add the rules of `directory`/.gitignore; returns its path if it exists."""
+        path = os.path.join(directory, ".gitignore")
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line.lstrip("!")
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            self.rules.append((directory, line.lstrip("/"), negate, dir_only, anchored))
+        return path
+
+    def ignored(self, full_path: str, is_dir: bool) -> bool:
+        result = False
+        name = os.path.basename(full_path)
+        for base, pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if not full_path.startswith(base + os.sep):
+                continue
+            rel = os.path.relpath(full_path, base).replace(os.sep, "/")
+            target = rel if anchored else name
+            if fnmatch.fnmatch(target, pattern) or (
+                anchored
+                and pattern.startswith("**/")
+                and fnmatch.fnmatch(name, pattern[3:])
+            ):
+                result = not negate
+        return result
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "K", "M"):
+        if size < 1024:
+            return f"{size}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}G"
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _build_tree(root: str, max_depth: int, max_entries: int) -> Tuple[Dict[str, int], str]:
+    """
+    Breadth-first walk, so a tight entry budget still shows every top-level
+    entry before descending. Returns the mtimes to validate the cache with.
+    """
+    signature: Dict[str, int] = {}
+    ignore = GitIgnore()
+
+    # .gitignore files between the project root and `root` apply too
+    chain, current = [], root
+    while current.startswith(BASE_DIR) and current != os.path.dirname(current):
+        chain.append(current)
+        if current == BASE_DIR:
+            break
+        current = os.path.dirname(current)
+    for directory in reversed(chain[1:]):
+        gitignore = ignore.load(directory)
+        if gitignore:
+            signature[gitignore] = _mtime(gitignore)
+
+    children: Dict[str, List[Tuple[str, bool, int]]] = {}
+    hidden: Dict[str, int] = {}  # dirs not expanded (depth/budget) -> entry count
+    shown = 0
+    truncated = False
+    queue = deque([(root, 0)])
+
+    while queue:
+        directory, depth = queue.popleft()
+        signature[directory] = _mtime(directory)
+        gitignore = ignore.load(directory)
+        if gitignore:
+            signature[gitignore] = _mtime(gitignore)
+
+        try:
+            with os.scandir(directory) as it:
+                entries = [
+                    e
+                    for e in it
+                    if not (e.is_dir(follow_symlinks=False) and e.name in VENDOR_DIRS)
+                    and not ignore.ignored(e.path, e.is_dir(follow_symlinks=False))
+                ]
+        except OSError:
+            continue
+
+        if depth >= max_depth or truncated:
+            hidden[directory] = len(entries)
+            continue
+
+        # Directories first, then files, alphabetically
+        entries.sort(key=lambda e: (not e.is_dir(follow_symlinks=False), e.name.lower()))
+        listed = []
+        for e in entries:
+            if shown >= max_entries:
+                truncated = True
+                break
+            is_dir = e.is_dir(follow_symlinks=False)
+            size = 0
+            if not is_dir:
+                st = e.stat(follow_symlinks=False)
+                size = st.st_size
+                # Rewriting a file in place leaves its directory's mtime alone
+                signature[e.path] = _mtime(e.path) if e.is_symlink() else st.st_mtime_ns
+            listed.append((e.path, is_dir, size))
+            shown += 1
+            if is_dir:
+                queue.append((e.path, depth + 1))
+        children[directory] = listed
+        if len(listed) < len(entries):
+            hidden[directory] = len(entries) - len(listed)
+
+    label = f"{os.path.relpath(root, BASE_DIR)}/"
+    if root not in children and root in hidden:
+        label += f" [{hidden[root]} entries]"  # max_depth=0
+    lines = [label]
+
+    def render(directory: str, indent: str):
+        for path, is_dir, size in children.get(directory, []):
+            name = os.path.basename(path)
+            if is_dir:
+                collapsed = path not in children and path in hidden
+                note = f" [{hidden[path]} entries]" if collapsed else ""
+                lines.append(f"{indent}{name}/{note}")
+                render(path, indent + "  ")
+            else:
+                lines.append(f"{indent}{name} ({_format_size(size)})")
+        if directory in children and directory in hidden:
+            lines.append(f"{indent}... {hidden[directory]} more")
+
+    render(root, "  ")
+    if truncated:
+        lines.append(f"(truncated at {max_entries} entries; query a subdirectory for more)")
+    return signature, "\n".join(lines)
+
+
+class ProjectTreeInput(BaseModel):
+    path: str = Field(".", description="Directory path relative to project root")
+    max_depth: int = Field(4, description="How many directory levels to descend")
+    max_entries: int = Field(400, description="Maximum number of entries to list")
+
+
+@tool("project_tree", args_schema=ProjectTreeInput, return_direct=False)
+def project_tree_tool(path: str = ".", max_depth: int = 4, max_entries: int = 400) -> str:
+    """Show the recursive file tree of a directory with file sizes (skips .gitignore'd and vendor files). Use this first to learn the project layout."""
+    root = os.path.normpath(os.path.join(BASE_DIR, path))
+    # Symlinks are resolved too, so a link can't lead the walk out of the project
+    real_base = os.path.realpath(BASE_DIR)
+    real_root = os.path.realpath(root)
+    if real_root != real_base and not real_root.startswith(real_base + os.sep):
+        return f"Path is outside the project: {path}"
+    if not os.path.isdir(root):
+        return f"Directory not found: {path}"
+
+    key = (root, max_depth, max_entries)
+    cached = _tree_cache.get(key)
+    # Adding, removing or renaming an entry changes its directory's mtime, an edit the file's
+    if cached and all(_mtime(p) == m for p, m in cached[0].items()):
+        return cached[1]
+
+    try:
+        signature, tree = _build_tree(root, max_depth, max_entries)
+    except Exception as e:
+        return f"Error building tree for {path}: {str(e)}"
+
+    if len(_tree_cache) >= MAX_CACHED_TREES:
+        _tree_cache.pop(next(iter(_tree_cache)))
+    _tree_cache[key] = (signature, tree)
+    return tree
@@ -1,7 +1,5 @@
 import requests, os
-from bs4 import BeautifulSoup
-from langchain.tools import tool
-from langchain_community.tools.ddg_search.tool import DuckDuckGoSearchResults
+from langchain_core.tools import tool
 
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 
@@ -33,6 +31,9 @@ def fetch_website_text(url: str, max_chars: int = 4000) -> str:
     """
     Fetch and clean readable text content from a webpage.
     """
+    # bs4 is only needed here, keep it off the startup path
+    from bs4 import BeautifulSoup
+
     try:
         response = requests.get(url, timeout=10)
         response.raise_for_status()
@@ -1,5 +1,8 @@
 const BASE = "http://127.0.0.1:8000";
 
+// Identifies this editor to the backend's per-client speculative autocomplete slot
+const CLIENT_ID = Math.random().toString(36).slice(2);
+
 interface SessionResponse {
     session_id: string;
 }
@@ -9,6 +12,23 @@ interface ResetResponse {
     session_id: string;
 }
 
+interface SessionSummary {
+    session_id: string;
+    name: string;
+    last_updated: string;
+}
+
+interface SessionListResponse {
+    sessions: SessionSummary[];
+    next_cursor: string | null;
+}
+
+interface SessionMessage {
+    role: string;
+    content: string;
+    ts?: string;
+}
+
 interface ModelStateResponse {
     status: string;
     model: string;
@@ -18,16 +38,71 @@ interface ModelStateResponse {
 }
 
 
+interface StreamEvent {
+    id?: number;
+    event: string;
+    data: any;
+}
+
+const MAX_RESUME_ATTEMPTS = 3;
+
+async function readEvents(
+    body: ReadableStream<Uint8Array>,
+    onEvent: (event: StreamEvent) => void
+): Promise<boolean> {
+    // Parses server-sent events; resolves true once the "done" event arrived
+    const reader = body.getReader();
+    const decoder = new TextDecoder("utf-8");
+    let buffered = "";
+
+    try {
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) return false;
+            buffered += decoder.decode(value, { stream: true });
+
+            let boundary: number;
+            while ((boundary = buffered.indexOf("\n\n")) >= 0) {
+                const frame = buffered.slice(0, boundary);
+                buffered = buffered.slice(boundary + 2);
+
+                const event: StreamEvent = { event: "message", data: null };
+                for (const line of frame.split("\n")) {
+                    if (line.startsWith("id: ")) event.id = Number(line.slice(4));
+                    else if (line.startsWith("event: ")) event.event = line.slice(7);
+                    else if (line.startsWith("data: ")) event.data = JSON.parse(line.slice(6));
+                }
+                if (event.data === null) continue; // retry / keep-alive frames
+
+                onEvent(event);
+                if (event.event === "done") return true;
+            }
+        }
+    } catch (error) {
+        reader.cancel();
+        throw error;
+    }
+}
+
+export async function cancelStream(stream_id: string) {
+    const res = await fetch(`${BASE}/stream-code/${stream_id}/cancel`, { method: "POST" });
+    if (!res.ok) {
+        console.warn(`cancelStream failed: ${res.status}`);
+    }
+}
+
 export async function streamCode(
     code: string,
     instruction: string,
     onChunk: (chunk: string) => void,
-    session_id: string
+    session_id: string,
+    signal?: AbortSignal
 ) {
     const response = await fetch(`${BASE}/stream-code`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ code, instruction, session_id }),
+        signal,
     });
 
     if (!response.ok) {
@@ -42,19 +117,40 @@ export async function streamCode(
 
     if (!response.body) throw new Error("No response body from server");
 
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder("utf-8");
+    const streamId = response.headers.get("X-Stream-Id");
+    let lastEventId = 0;
+    let body: ReadableStream<Uint8Array> = response.body;
 
-    try{
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-            const chunk = decoder.decode(value, { stream: true });
-            onChunk(chunk); // stream each chunk to VSCode
+    const onEvent = (ev: StreamEvent) => {
+        if (ev.id !== undefined) lastEventId = ev.id;
+        if (ev.event === "token" || ev.event === "tool_output") {
+            onChunk(ev.data.text); // stream each chunk to VSCode
+        } else if (ev.event === "error" || ev.event === "cancelled") {
+            onChunk(`\n❌ ${ev.data.message}\n`);
+        }
+    };
+
+    for (let attempt = 0; ; attempt++) {
+        let failure: unknown = new Error("Stream ended before completion");
+        try {
+            if (await readEvents(body, onEvent)) return;
+        } catch (error) {
+            failure = error;
+        }
+        if (signal?.aborted) {
+            // Stop the agent run on the backend instead of letting it finish unseen
+            if (streamId) await cancelStream(streamId);
+            return;
         }
-    } catch(error){
-        reader.cancel()
-        throw error
+        if (!streamId || attempt >= MAX_RESUME_ATTEMPTS) throw failure;
+
+        // Resume where we left off; the backend replays buffered events
+        const res = await fetch(`${BASE}/stream-code/${streamId}`, {
+            headers: { "Last-Event-ID": String(lastEventId) },
+            signal,
+        });
+        if (!res.ok || !res.body) throw failure;
+        body = res.body;
     }
 }
 
@@ -68,6 +164,18 @@ export async function getCurrentSession(): Promise<string> {
     return data.session_id;
 }
 
+export async function setCurrentSession(session_id: string) {
+    const res = await fetch(`${BASE}/current-session`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ session_id }),
+    });
+    if (!res.ok) {
+        const txt = await res.text();
+        throw new Error(`setCurrentSession failed: ${res.status} ${txt}`);
+    }
+}
+
 export async function createSession(name?: string, makeCurrent: boolean = false): Promise<string> {
     const res = await fetch(`${BASE}/sessions`, {
         method: "POST",
@@ -97,6 +205,54 @@ export async function resetSession(session_id: string): Promise<ResetResponse> {
     return (await res.json()) as ResetResponse;
 }
 
+export async function listSessions(cursor?: string, limit: number = 100): Promise<SessionListResponse> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set("cursor", cursor);
+
+    const res = await fetch(`${BASE}/sessions?${params}`);
+    if (!res.ok) {
+        const txt = await res.text();
+        throw new Error(`listSessions failed: ${res.status} ${txt}`);
+    }
+    return (await res.json()) as SessionListResponse;
+}
+
+export async function streamSessionHistory(
+    session_id: string,
+    onMessage: (message: SessionMessage) => void
+) {
+    // History arrives as NDJSON so long sessions can be rendered incrementally
+    const res = await fetch(`${BASE}/session/${encodeURIComponent(session_id)}/stream`);
+    if (!res.ok) {
+        const txt = await res.text();
+        throw new Error(`streamSessionHistory failed: ${res.status} ${txt}`);
+    }
+    if (!res.body) throw new Error("No response body from server");
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder("utf-8");
+    let buffered = "";
+
+    try {
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+
+            let newline: number;
+            while ((newline = buffered.indexOf("\n")) >= 0) {
+                const line = buffered.slice(0, newline).trim();
+                buffered = buffered.slice(newline + 1);
+                if (line) onMessage(JSON.parse(line) as SessionMessage);
+            }
+        }
+        if (buffered.trim()) onMessage(JSON.parse(buffered) as SessionMessage);
+    } catch (error) {
+        reader.cancel();
+        throw error;
+    }
+}
+
 export async function requestAutocomplete(
   before: string,
   after: string,
@@ -113,6 +269,7 @@ export async function requestAutocomplete(
       language,
       max_tokens,
       top_k,
+      client_id: CLIENT_ID,
     }),
   });
   if (!res.ok) {
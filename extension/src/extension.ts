@@ -1,10 +1,22 @@
 import * as vscode from "vscode";
-import { streamCode, getCurrentSession, createSession, resetSession, requestAutocomplete, setModelState } from "./apiClient";
+import {
+    streamCode,
+    getCurrentSession,
+    setCurrentSession,
+    createSession,
+    resetSession,
+    listSessions,
+    streamSessionHistory,
+    requestAutocomplete,
+    setModelState,
+} from "./apiClient";
 
 const LANGUAGES = ["python", "javascript", "typescript", "c++", "c"];
 
 let statusBarItem: vscode.StatusBarItem;
 
+let historyChannel: vscode.OutputChannel | undefined;
+
 let previousChatState: boolean | undefined;
 let previousAutoState: boolean | undefined;
 
@@ -144,9 +156,20 @@ async function callAgent(instruction: string, code?: string) {
     const sid = await ensureSession();
 
     try {
-        await streamCode(code || "", instruction, (chunk: string) => {
-            outputChannel.append(chunk); 
-        }, sid);
+        await vscode.window.withProgress(
+            {
+                location: vscode.ProgressLocation.Notification,
+                title: "AI Assistant is working...",
+                cancellable: true,
+            },
+            async (_progress, token) => {
+                const controller = new AbortController();
+                token.onCancellationRequested(() => controller.abort());
+                await streamCode(code || "", instruction, (chunk: string) => {
+                    outputChannel.append(chunk); 
+                }, sid, controller.signal);
+            }
+        );
     } catch (err: any) {
         if (err.message.includes("503") || err.message.includes("disabled")) {
             vscode.window.showErrorMessage(
@@ -163,6 +186,51 @@ async function callAgent(instruction: string, code?: string) {
     }
 }
 
+async function pickSession(): Promise<string | undefined> {
+    // Sessions are fetched one page at a time; "Load more" fetches the next page
+    const picks: (vscode.QuickPickItem & { session_id?: string })[] = [];
+    let cursor: string | undefined;
+
+    while (true) {
+        const page = await listSessions(cursor, 50);
+        for (const s of page.sessions) {
+            picks.push({ label: s.name || s.session_id, description: s.last_updated, session_id: s.session_id });
+        }
+        const items = page.next_cursor ? [...picks, { label: "$(ellipsis) Load more sessions..." }] : picks;
+
+        const choice = await vscode.window.showQuickPick(items, { placeHolder: "Open a session" });
+        if (!choice) return undefined;
+        if (choice.session_id) return choice.session_id;
+        cursor = page.next_cursor ?? undefined;
+    }
+}
+
+async function openSession() {
+    let sid: string | undefined;
+    try {
+        sid = await pickSession();
+    } catch (err: any) {
+        vscode.window.showErrorMessage(`Could not list sessions: ${err.message}`);
+        return;
+    }
+    if (!sid) return;
+
+    if (!historyChannel) historyChannel = vscode.window.createOutputChannel("AI Assistant History");
+    const channel = historyChannel;
+    channel.clear();
+    channel.show(true);
+
+    try {
+        await setCurrentSession(sid);
+        // Messages are appended as they arrive, so long sessions don't block the UI
+        await streamSessionHistory(sid, (message) => {
+            channel.appendLine(`[${message.role}] ${message.content}\n`);
+        });
+    } catch (err: any) {
+        vscode.window.showErrorMessage(`Could not open session: ${err.message}`);
+    }
+}
+
 export function activate(context: vscode.ExtensionContext) {
     console.log('Extension "simple-code-agent" is active!');
     
@@ -204,6 +272,8 @@ export function activate(context: vscode.ExtensionContext) {
         }
     });
 
+    const openSessionDisposable = vscode.commands.registerCommand("simple-code-agent.openSession", openSession);
+
     // 2. Toggle Command (Quick Pick UI) ---
     const toggleDisposable = vscode.commands.registerCommand("simple-code-agent.toggleSettings", async () => {
         const config = vscode.workspace.getConfiguration("localAI");
@@ -292,7 +362,7 @@ export function activate(context: vscode.ExtensionContext) {
         new AIInlineCompletionProvider()
     );
 
-    context.subscriptions.push(askAIDisposable, resetDisposable, toggleDisposable, inlineProvider); 
+    context.subscriptions.push(askAIDisposable, resetDisposable, openSessionDisposable, toggleDisposable, inlineProvider); 
     console.log("AI Assistant extension fully activated");
 }
 